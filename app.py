@@ -1,140 +1,466 @@
 # import libraries
+import os
 import re
+import uuid
+import logging
+import hashlib
+import contextvars
+import tracemalloc
 import streamlit as st
 import pandas as pd
-import janitor
 import streamlit.components.v1 as components
-from zipfile import ZipFile
-from pathlib import Path
-import shutil
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # helper functions
 from helpers import *
+from ingest import EXPORT_TABLES, get_data, read_messages
+from store import Store, account_key
+from search import SearchIndex
+from profiling import Trace, profiled, log as profiling_log
 
 
-def get_data(usr_file, data="connections") -> pd.DataFrame:
+# number of processed uploads kept in memory (least recently used are evicted)
+CACHE_MAX_ENTRIES = int(os.getenv("LINKEDIN_CACHE_MAX_ENTRIES", 8))
+# set LINKEDIN_CACHE_PERSIST=disk to keep processed uploads across restarts
+CACHE_PERSIST = os.getenv("LINKEDIN_CACHE_PERSIST") or None
 
-    if usr_file is None:
-        return
 
-    with ZipFile(usr_file, "r") as zipObj:
-        # Extract all the contents of zip file in current directory
-        zipObj.extractall("data")
+# set LINKEDIN_STORE to a sqlite file to only process what's new on re-uploads
+STORE_PATH = os.getenv("LINKEDIN_STORE")
 
-    raw_df = pd.read_csv("data/Connections.csv", skiprows=3)
 
-    if data == "messages":
-        raw_df = pd.read_csv("data/messages.csv")
+@st.experimental_singleton
+def local_store() -> Store:
+    """Store of previously processed exports, None when not configured"""
+    return Store(STORE_PATH) if STORE_PATH else None
 
-    # delete the data
-    shutil.rmtree("data", ignore_errors=True)
 
-    return raw_df
+# set LINKEDIN_PROFILE_MEMORY=1 to also trace the memory of each stage (slower)
+PROFILE_MEMORY = bool(os.getenv("LINKEDIN_PROFILE_MEMORY"))
+# set LINKEDIN_TRACE_LOG to a file to append the stages of all sessions as json lines
+TRACE_LOG = os.getenv("LINKEDIN_TRACE_LOG")
 
 
-def main():
-    # streamlit config
-    st.set_page_config(
-        page_title="Linkedin Network Visualizer",
-        page_icon="🕸️",
-        initial_sidebar_state="expanded",
-        layout="wide",
-    )
-    st.markdown(
-        """
-        <h1 style='text-align: center; color: whtie;'>Linkedin Network Visualizer</h1>
-        <h3 style='text-align: center; color: white;'>The missing feature in LinkedIn</h3>
+@st.experimental_singleton
+def setup_profiling():
+    """Starts tracing memory and logging stages once per server, as configured"""
 
-        """,
-        unsafe_allow_html=True,
-    )
+    if PROFILE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
 
-    # center image
-    col1, col2, col3 = st.columns([1, 5, 1])
-    col2.image("media/app/everything.png", use_column_width=True)
+    if TRACE_LOG:
+        handler = logging.FileHandler(TRACE_LOG)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        profiling_log.addHandler(handler)
+        profiling_log.setLevel(logging.INFO)
 
-    st.subheader("First, upload your data 💾")
-    st.caption(
-        """
-    Don't know where to find it?
-    [Click here](https://github.com/benthecoder/linkedin-visualizer/tree/main/data_guide#how-to-get-the-data).
+
+def session_trace() -> Trace:
+    """Trace of the stages run for this session"""
+    return st.session_state.setdefault("trace", Trace(uuid.uuid4().hex))
+
+
+# threads shared by all sessions for the expensive sections
+WORKERS = int(os.getenv("LINKEDIN_WORKERS", os.cpu_count() or 2))
+# jobs, and so their results, each session holds on to at most
+SESSION_MAX_JOBS = int(os.getenv("LINKEDIN_SESSION_MAX_JOBS", 8))
+
+
+@st.experimental_singleton
+def executor() -> ThreadPoolExecutor:
+    """Thread pool running the expensive sections in the background"""
+    return ThreadPoolExecutor(max_workers=WORKERS)
+
+
+def submit(key: tuple, fn, *args):
+    """Runs fn(*args) on the pool once per session and key, its stages are
+    recorded in the session's trace
+
+    The second item of every key is the content hash of the upload. Jobs of
+    other uploads are dropped, then the least recently used ones beyond
+    SESSION_MAX_JOBS. A failed job is run again when it's submitted again.
+
+    Returns:
+        Future: the pending or finished job
+    """
+
+    jobs = st.session_state.setdefault("jobs", OrderedDict())
+    for other in [other for other in jobs if other[1] != key[1]]:
+        del jobs[other]
+
+    job = jobs.get(key)
+    if job is None or (job.done() and job.exception() is not None):
+        context = contextvars.copy_context()
+        jobs[key] = executor().submit(context.run, fn, *args)
+    jobs.move_to_end(key)
+
+    while len(jobs) > SESSION_MAX_JOBS:
+        jobs.popitem(last=False)
+
+    return jobs[key]
+
+
+def file_hash(usr_file) -> str:
+    """Returns the sha256 hex digest of the uploaded file's content"""
+
+    h = hashlib.sha256()
+    usr_file.seek(0)
+    for chunk in iter(lambda: usr_file.read(1 << 20), b""):
+        h.update(chunk)
+    usr_file.seek(0)
+
+    return h.hexdigest()
+
+
+@st.experimental_memo(
+    max_entries=CACHE_MAX_ENTRIES, persist=CACHE_PERSIST, show_spinner=False
+)
+def process_data(content_hash: str, _usr_file) -> dict:
+    """Parses, cleans and aggregates the connections of an upload. Cached on
+    the content hash of the zip, so widget changes on the same upload skip all of this
+
+    Args:
+        content_hash (str): hash of the upload, used as the cache key
+        _usr_file: uploaded zip file (not hashed by streamlit)
+
+    Returns:
+        dict: raw and cleaned connections and their aggregates
     """
+
+    data = get_data(_usr_file, data=("connections",))
+    raw = data["connections"]
+
+    account = account_key(raw)
+    store = local_store()
+    if store is not None:
+        df_clean = store.update_connections(account, raw)
+    else:
+        df_clean = clean_df(raw)
+
+    return {
+        "account": account,
+        "connections": raw,
+        "clean": df_clean,
+        # oldest first, for slicing date windows by binary search
+        "by_date": df_clean.sort_values("connected_on", kind="stable"),
+        "company": agg_sum(df_clean, "company"),
+        "position": agg_sum(df_clean, "position"),
+        "timeline": TimeAggregates.from_dates(df_clean["connected_on"]),
+    }
+
+
+def filter_widgets(data: dict) -> tuple:
+    """Sidebar date range, company and position filters
+
+    Returns:
+        tuple: first day, last day, companies and positions, None when nothing
+            is filtered. The days are None unless the range was narrowed on that side
+    """
+
+    dates = data["by_date"]["connected_on"].dropna()
+    if dates.empty:
+        return None
+    first, last = dates.iloc[0].date(), dates.iloc[-1].date()
+
+    st.sidebar.subheader("Filters")
+    picked = st.sidebar.date_input(
+        "Date range", value=(first, last), min_value=first, max_value=last, key="6"
+    )
+    # a single date while the range is being picked
+    if not isinstance(picked, (tuple, list)):
+        picked = (picked,)
+    start = picked[0] if len(picked) > 0 else first
+    end = picked[1] if len(picked) > 1 else last
+
+    companies = st.sidebar.multiselect("Companies", data["company"]["company"], key="7")
+    positions = st.sidebar.multiselect(
+        "Positions", data["position"]["position"], key="8"
     )
-    # upload files
-    usr_file = st.file_uploader("Drop your zip file 👇", type={"zip"})
 
-    df_ori = get_data(usr_file)
+    # the other sections have dates outside the connections', those stay in
+    # unless the range was narrowed on their side
+    start = start if start > first else None
+    end = end if end < last else None
 
-    # if data not uploaded yet, return None
-    if df_ori is None:
-        return
+    if start is None and end is None and not companies and not positions:
+        return None
 
-    df_clean = clean_df(df_ori)
+    return start, end, tuple(companies), tuple(positions)
 
-    with st.expander("Show raw data"):
-        st.dataframe(df_ori)
 
-    # Data wrangling
-    agg_df_company = agg_sum(df_clean, "company")
-    agg_df_position = agg_sum(df_clean, "position")
+@st.experimental_memo(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def filter_data(content_hash: str, window: tuple, _data: dict) -> dict:
+    """The connections of a date range, companies and positions with their
+    aggregates recomputed, in the layout of process_data
+
+    Args:
+        content_hash (str): hash of the upload, used as the cache key
+        window (tuple): first day, last day, companies and positions from filter_widgets
+        _data (dict): processed upload from process_data (not hashed by streamlit)
+
+    Returns:
+        dict: filtered connections and their aggregates
+    """
 
-    this_month_df = df_clean[
-        (df_clean["connected_on"].dt.month == 1)
-        & (df_clean["connected_on"].dt.year == 2022)
+    start, end, companies, positions = window
+
+    df = date_slice(_data["by_date"], "connected_on", start, end)
+    if companies:
+        df = df[df["company"].isin(companies)]
+    if positions:
+        df = df[df["position"].isin(positions)]
+
+    return {
+        **_data,
+        # newest first like the export
+        "clean": df.iloc[::-1],
+        "by_date": df,
+        "company": agg_sum(df, "company"),
+        "position": agg_sum(df, "position"),
+        "timeline": TimeAggregates.from_dates(df["connected_on"]),
+    }
+
+
+@st.experimental_memo(
+    max_entries=CACHE_MAX_ENTRIES, persist=CACHE_PERSIST, show_spinner=False
+)
+def process_messages(content_hash: str, _usr_file, _account: str = None) -> dict:
+    """Parses and aggregates the messages of an upload, only once the chats
+    section is opened. Cached on the content hash of the zip
+
+    Args:
+        content_hash (str): hash of the upload, used as the cache key
+        _usr_file: uploaded zip file (not hashed by streamlit)
+        _account (str, optional): account key of the upload (not hashed by streamlit)
+
+    Returns:
+        dict: aggregates of the messages, empty if the export has no messages
+    """
+
+    store = local_store()
+    if store is not None and _account is not None:
+        chats = store.update_messages(_account, read_messages, _usr_file)
+    else:
+        chats = read_messages(_usr_file)
+
+    # a messages.csv with only its header has no conversations to show
+    if chats is None or chats.messages.empty:
+        return {}
+
+    return chat_tables(chats)
+
+
+@st.experimental_memo(
+    max_entries=CACHE_MAX_ENTRIES, persist=CACHE_PERSIST, show_spinner=False
+)
+def process_tables(content_hash: str, _usr_file) -> dict:
+    """Reads the invitations, positions, skills, endorsements and reactions
+    of an upload in parallel, only once their section is opened. Cached on
+    the content hash of the zip
+
+    Args:
+        content_hash (str): hash of the upload, used as the cache key
+        _usr_file: uploaded zip file (not hashed by streamlit)
+
+    Returns:
+        dict: data frame of each table found in the export
+    """
+    return get_data(_usr_file, data=EXPORT_TABLES)
+
+
+@st.experimental_memo(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def chats_in_window(content_hash: str, start, end, _chats: ChatAggregates) -> dict:
+    """Aggregates of the messages from the day start through the day end
+
+    Args:
+        content_hash (str): hash of the upload, used as the cache key
+        start: first day of the window
+        end: last day of the window
+        _chats (ChatAggregates): aggregates of all messages (not hashed by streamlit)
+
+    Returns:
+        dict: aggregates of the messages in the window, empty if there are none
+    """
+
+    chats = _chats.window(start, end)
+    if chats.messages.empty:
+        return {}
+
+    return chat_tables(chats)
+
+
+@st.experimental_memo(
+    max_entries=CACHE_MAX_ENTRIES, persist=CACHE_PERSIST, show_spinner=False
+)
+def search_index(
+    content_hash: str,
+    with_messages: bool,
+    _connections: pd.DataFrame,
+    _chats: ChatAggregates = None,
+) -> SearchIndex:
+    """Search index of the connections and, once they are read, the
+    conversations of an upload. Cached on the content hash of the zip
+
+    Args:
+        content_hash (str): hash of the upload, used as the cache key
+        with_messages (bool): whether the messages are indexed, part of the cache key
+        _connections (pd.DataFrame): cleaned connections (not hashed by streamlit)
+        _chats (ChatAggregates, optional): aggregates of the messages (not hashed by streamlit)
+
+    Returns:
+        SearchIndex: index of the connections and conversations
+    """
+    return SearchIndex.build(_connections, _chats)
+
+
+def chat_tables(chats: ChatAggregates) -> dict:
+    """The tables the chats section shows of the aggregates"""
+    return {
+        "chats": chats,
+        "index": chats.index,
+        "FROM": chats.agg("FROM"),
+        "TO": chats.agg("TO"),
+        "chat_timeline": chats.timeline,
+        "words": chats.words,
+    }
+
+
+def render_wordcloud(chats_job) -> bytes:
+    """Waits for the messages job and renders their wordcloud"""
+
+    chats = chats_job.result()
+    if not chats:
+        return None
+
+    words = chats["words"]
+    return plot_wordcloud(frequency_fingerprint(words), words)
+
+
+def network_jobs(
+    data: dict,
+    content_hash: str,
+    dataset: str,
+    cutoff: int,
+    log_bool: bool,
+    layout: bool,
+) -> list:
+    """Submits the company, position and company ↔ position networks of the
+    (filtered) dataset for a cutoff, log scale and layout"""
+
+    jobs = [
+        submit(
+            ("network", content_hash, dataset, col_name, cutoff, log_bool, layout),
+            generate_network,
+            data["clean"],
+            data[col_name],
+            log_bool,
+            cutoff,
+            dataset,
+            layout,
+        )
+        for col_name in ("company", "position")
     ]
+    jobs.append(
+        submit(
+            ("bipartite", content_hash, dataset, cutoff, log_bool),
+            generate_bipartite_network,
+            data["clean"],
+            data["company"],
+            data["position"],
+            log_bool,
+            cutoff,
+            dataset,
+        )
+    )
 
-    # Getting some stats
-    total_conn = len(df_ori)
-    top_pos = agg_df_position["position"][0]
-    top_comp = agg_df_company["company"][0]
-    second_comp = agg_df_company["company"][1]
-    top_pos_count = agg_df_position["count"][0]
-    first_c = df_clean.iloc[-1]
-    last_c = df_clean.iloc[0]
+    return jobs
 
-    # calculating stats
-    st.markdown(
-        """
-        ---
-        ### Here's a breakdown of your connections 👇
-        """
+
+def chat_jobs(usr_file, content_hash: str, account: str) -> tuple:
+    """Submits parsing the messages and rendering their wordcloud
+
+    Returns:
+        tuple: messages job and wordcloud job
+    """
+
+    # the pool reads its own copy of the upload
+    chats_job = submit(
+        ("messages", content_hash),
+        lambda: process_messages(content_hash, BytesIO(usr_file.getvalue()), account),
     )
+    wordcloud_job = submit(("wordcloud", content_hash), render_wordcloud, chats_job)
 
-    # Metrics
-    pos, comp, conn = st.columns(3)
-    pos.metric("Top Position", f"{top_pos[0:18]}..." if len(top_pos) > 18 else top_pos)
-    comp.metric(
-        "Top Company", f"{top_comp[0:18]}..." if len(top_comp) > 18 else top_comp
+    return chats_job, wordcloud_job
+
+
+def prefetch(usr_file, content_hash: str, data: dict):
+    """Starts the expensive sections in the background as soon as the
+    connections are parsed, so they are ready or underway when opened"""
+
+    network_jobs(
+        data,
+        content_hash,
+        content_hash,
+        st.session_state.get("3", 6),
+        st.session_state.get("4", False),
+        st.session_state.get("5", False),
     )
-    conn.metric("Total Connections", f"{total_conn}", len(this_month_df))
+    chat_jobs(usr_file, content_hash, data["account"])
 
-    # Summary
-    st.subheader("Full summary")
-    st.markdown(
-        f"""
-        - You have _{len(this_month_df)}_ new ⭐ connections this month, with a total of _{total_conn}_!
-        - Most of your connections work at **{top_comp}**" (dream company?), closely followed by {second_comp}
-        - You love connecting with people 🤵 with the title – **{top_pos}**, _{top_pos_count}_ of them!
-        - Your first ever connection is {first_c['name']} and they work as a {first_c.position} at {first_c.company}
-        - Your most recent connection is {last_c['name']} and they work as a {last_c.position} at {last_c.company}
 
-        ---
-        """
+@profiled
+def show_search(usr_file, content_hash: str, data: dict):
+    """Search box over all connections and conversations, the filters don't apply"""
+
+    query = st.text_input(
+        "Search your connections and messages 🔎",
+        placeholder="name, company, position, email or anything you wrote",
+        key="9",
     )
+    if not query:
+        return
 
-    st.caption("Scroll down 🖱️⬇️ to see some cool visualizations!")
+    # connections are searched right away, messages once they are read, and
+    # not at all if reading them failed
+    chats_job, _ = chat_jobs(usr_file, content_hash, data["account"])
+    failed = chats_job.done() and chats_job.exception() is not None
+    with_messages = chats_job.done() and not failed
+    chats = chats_job.result().get("chats") if with_messages else None
+
+    index = search_index(content_hash, with_messages, data["clean"], chats)
+    results = index.search(query)
+
+    if failed:
+        st.caption("Couldn't read your messages, only connections are searched")
+    elif not with_messages:
+        st.caption("Still reading your messages, only connections are searched")
+    if results.empty:
+        st.write(f"Nothing matches _{query}_ 🤷")
+        return
+
+    st.write(f"Top {len(results)} matches")
+    st.dataframe(results)
 
-    # visualizations
+
+@profiled
+def show_bar_charts(data: dict, dataset: str):
     st.sidebar.subheader("Bar Charts")
     top_n = st.sidebar.slider("Top n", 0, 50, 10, key="1")
 
+    agg_df_company = data["company"]
+    agg_df_position = data["position"]
+
     # top n companies and positions
     st.subheader(f"Top {top_n} companies & positions")
 
     company_plt, positions_plt = st.columns(2)
-    company_plt.plotly_chart(plot_bar(agg_df_company, top_n), use_container_width=True)
+    company_plt.plotly_chart(
+        plot_bar(agg_df_company, top_n, dataset=dataset), use_container_width=True
+    )
     positions_plt.plotly_chart(
-        plot_bar(agg_df_position, top_n), use_container_width=True
+        plot_bar(agg_df_position, top_n, dataset=dataset), use_container_width=True
     )
 
     col1, col2 = st.columns(2)
@@ -145,17 +471,26 @@ def main():
         with st.expander("View top positions data", expanded=True):
             st.dataframe(agg_df_position)
 
+
+@profiled
+def show_timeline(data: dict):
     # connections timeline
+    timeline = data["timeline"]
+    freq = timeline.auto_freq()
+
     st.subheader("Timeline of connections")
-    st.plotly_chart(plot_timeline(df_clean), use_container_width=True)
+    st.plotly_chart(plot_timeline(timeline, freq), use_container_width=True)
 
     st.write("let's look at on what days do you have the most connections")
-    st.plotly_chart(plot_day(df_clean), use_container_width=True)
+    st.plotly_chart(plot_day(timeline), use_container_width=True)
 
     # cumulative graph
     st.subheader("Connections overtime")
-    st.plotly_chart(plot_cumsum(df_clean), use_container_width=True)
+    st.plotly_chart(plot_cumsum(timeline, freq), use_container_width=True)
+
 
+@profiled
+def show_networks(data: dict, content_hash: str, dataset: str):
     # Graph network
     st.sidebar.subheader("Connection network")
     network_num = st.sidebar.slider(
@@ -166,69 +501,383 @@ def main():
         key="3",
     )
 
-    log_bool = False
-    if st.sidebar.checkbox("Log scale"):
-        log_bool = True
+    log_bool = st.sidebar.checkbox("Log scale", key="4")
+    layout = st.sidebar.checkbox(
+        "Lay out on the server (faster for large networks)", key="5"
+    )
 
     st.subheader("Company Network")
-    generate_network(df_clean, agg_df_company, log_bool, network_num)
-
+    company_slot = st.empty()
     st.subheader("Positions Network")
-    generate_network(df_clean, agg_df_position, log_bool, network_num)
+    position_slot = st.empty()
+    st.subheader("Companies ↔ Positions Network")
+    bipartite_slot = st.empty()
+
+    jobs = network_jobs(data, content_hash, dataset, network_num, log_bool, layout)
+    slots = dict(zip(jobs, [company_slot, position_slot, bipartite_slot]))
 
+    # fill in each network as soon as it is built
+    for slot in slots.values():
+        slot.info("Network generating...")
+    for job in as_completed(slots):
+        with slots[job].container():
+            # Load HTML in HTML component for display on Streamlit page
+            components.html(job.result(), height=650, width=800)
+
+
+@profiled
+def show_emails(data: dict):
     # emails
+    df_clean = data["clean"]
+
     st.write("Now to put your connections to good use")
     st.subheader("Who can you cold email 📧?")
 
     emails = df_clean[df_clean.notnull()["email_address"]].drop(
-        ["connected_on", "weekday"], axis=1
+        ["connected_on"], axis=1
     )
 
     st.write(f"Answer: {len(emails)} of your connections shared their emails!")
     st.dataframe(emails)
 
-    st.sidebar.write(
-        "Interested in the code? Head over to the [Github Repo](https://github.com/benthecoder/linkedin-visualizer)"
-    )
 
+@profiled
+def show_chats(usr_file, content_hash: str, account: str, dates: tuple = None):
     # chats
-    st.markdown("---")
+    chats_job, wordcloud_job = chat_jobs(usr_file, content_hash, account)
+
+    with st.spinner("Reading your messages..."):
+        chats = chats_job.result()
+
+    if not chats:
+        st.write("Your export doesn't contain any messages 🤷")
+        return
+
+    # messages are only filtered by date, they have no company or position
+    dataset = content_hash
+    if dates is not None:
+        chats = chats_in_window(content_hash, dates[0], dates[1], chats["chats"])
+        dataset = f"{content_hash}:{dates[0]}:{dates[1]}"
+        if not chats:
+            st.write("No messages in the selected date range 🤷")
+            return
+
+    st.sidebar.subheader("Bar Charts")
+    top_n = st.sidebar.slider("Top n", 0, 50, 10, key="1")
+
     st.subheader("Chats analysis")
-    messages = get_data(usr_file, data="messages")
-    messages["DATE"] = pd.to_datetime(messages["DATE"], format="%Y-%m-%d %H:%M:%S UTC")
-    messages["DATE"] = (
-        messages["DATE"].dt.tz_localize("UTC").dt.tz_convert("US/Central")
-    )
+    aggregates = chats["chats"]
+    index = chats["index"]
+    threads = index.threads
 
     total, from_count, to_count = st.columns(3)
-    total.metric("Total Conversations", f"{messages['CONVERSATION ID'].nunique()}")
-    from_count.metric("Total Sent", f"{messages.FROM.nunique()}")
-    to_count.metric("Total Received", f"{messages.TO.nunique()}")
-
-    messages_FROM = agg_sum(messages, "FROM").iloc[1:]
-    messages_TO = agg_sum(messages, "TO").iloc[1:]
+    total.metric("Total Conversations", f"{len(threads)}")
+    from_count.metric("Total Sent", f"{threads['sent'].sum()}")
+    to_count.metric("Total Received", f"{threads['received'].sum()}")
+
+    you_reply, they_reply, response = st.columns(3)
+    you_reply.metric("You reply to", f"{index.reply_rate():.0%}")
+    they_reply.metric("Replies to you", f"{index.reply_rate(by_owner=False):.0%}")
+    response.metric(
+        "Your median response time", format_timedelta(index.response_times().median())
+    )
 
     from_plt, to_plt = st.columns(2)
     from_plt.plotly_chart(
-        plot_bar(messages_FROM, top_n, title="Messages FROM"), use_column_width=True
+        plot_bar(chats["FROM"], top_n, title="Messages FROM", dataset=dataset),
+        use_column_width=True,
     )
     to_plt.plotly_chart(
-        plot_bar(messages_TO, top_n, title="Messages TO"), use_column_width=True
+        plot_bar(chats["TO"], top_n, title="Messages TO", dataset=dataset),
+        use_column_width=True,
     )
 
+    with st.expander("View top correspondents data"):
+        st.dataframe(index.correspondents)
+
+    st.write("how long does it take to get a reply?")
+    st.plotly_chart(plot_response_times(index), use_container_width=True)
+
     st.write("what hour of the day do you have the most messages?")
 
-    st.plotly_chart(plot_chat_hour(messages), use_container_width=True)
+    st.plotly_chart(plot_chat_hour(chats["chat_timeline"]), use_container_width=True)
 
     st.write(
         "trend of your messages over time. p.s. hover over the line to see who you talked with"
     )
-    st.plotly_chart(plot_chat_people(messages), use_container_width=True)
+    st.plotly_chart(plot_chat_people(aggregates), use_container_width=True)
 
     st.subheader("wordcloud of all chats")
 
-    with st.spinner("Wordcloud generating..."):
-        st.pyplot(plot_wordcloud(messages))
+    words = chats["words"]
+    words_key = frequency_fingerprint(words)
+
+    wordcloud_slot = st.empty()
+    wordcloud_slot.info("Wordcloud generating...")
+    wordcloud_slot.image(wordcloud_job.result(), use_column_width=True)
+
+    if st.checkbox("Full resolution wordcloud"):
+        with st.spinner("Wordcloud generating..."):
+            st.download_button(
+                "Download wordcloud 📥",
+                plot_wordcloud(words_key, words, width=None),
+                file_name="wordcloud.png",
+                mime="image/png",
+            )
+
+
+@profiled
+def show_activity(usr_file, content_hash: str, data: dict, dates: tuple = None):
+    # invitations, endorsements and the rest of the export
+    with st.spinner("Reading the rest of your export..."):
+        tables = process_tables(content_hash, usr_file)
+
+    if not tables:
+        st.write("Your export doesn't contain invitations or endorsements 🤷")
+        return
+
+    # tables are only filtered by date, they have no company or position
+    def in_window(df: pd.DataFrame, column: str) -> pd.DataFrame:
+        if dates is None:
+            return df
+        days = df[column].dt.normalize()
+        keep = pd.Series(True, index=df.index)
+        if dates[0] is not None:
+            keep &= days >= pd.Timestamp(dates[0])
+        if dates[1] is not None:
+            keep &= days <= pd.Timestamp(dates[1])
+        return df[keep]
+
+    invitations = tables.get("invitations")
+    if invitations is not None:
+        st.subheader("Invitations 💌")
+        # every connection counts, not only the filtered ones
+        invites = invitation_acceptance(invitations, data["connections"])
+        invites = in_window(invites, "sent_at")
+
+        sent, received = st.columns(2)
+        sent.metric("Invitations sent", len(invites[invites["direction"] == "sent"]))
+        received.metric(
+            "Invitations received", len(invites[invites["direction"] == "received"])
+        )
+        sent.metric("Sent that connected", f"{acceptance_rate(invites):.0%}")
+        received.metric(
+            "Received that connected", f"{acceptance_rate(invites, 'received'):.0%}"
+        )
+
+        if not invites.empty:
+            st.plotly_chart(plot_invitations(invites), use_container_width=True)
+        with st.expander("View invitations data"):
+            st.dataframe(invites)
+
+    endorsements = tables.get("endorsements")
+    if endorsements is not None:
+        endorsements = in_window(endorsements, "Endorsement Date")
+
+        st.subheader("Endorsements 👍")
+        st.write(f"{len(endorsements)} endorsements for your skills")
+        if not endorsements.empty:
+            dataset = content_hash
+            if dates is not None:
+                dataset = f"{content_hash}:{dates[0]}:{dates[1]}"
+            st.caption("Who endorsed which of your skills")
+            components.html(
+                generate_endorsement_network(endorsements, dataset=dataset),
+                height=650,
+                width=800,
+            )
+
+    if "skills" in tables:
+        with st.expander("View your skills"):
+            st.dataframe(tables["skills"])
+    if "positions" in tables:
+        with st.expander("View your positions"):
+            st.dataframe(tables["positions"])
+    if "reactions" in tables:
+        reactions = in_window(tables["reactions"], "Date")
+        with st.expander(f"View your {len(reactions)} reactions"):
+            st.dataframe(reactions["Type"].value_counts())
+
+
+# sections of the page, only the selected one is computed on each rerun
+SECTIONS = [
+    "📊 Top companies & positions",
+    "📈 Timeline",
+    "🕸️ Networks",
+    "📧 Emails",
+    "💬 Chats",
+    "🤝 Invitations & endorsements",
+]
+
+
+def show_performance(trace: Trace):
+    """Optional sidebar panel with the stages of this session"""
+
+    st.sidebar.subheader("Performance")
+    if not st.sidebar.checkbox("Show stage timings", key="performance"):
+        return
+
+    summary = trace.summary()
+    if summary.empty:
+        st.sidebar.write("Nothing has run yet")
+        return
+
+    st.sidebar.dataframe(summary.round(3))
+    with st.sidebar.expander("All stages"):
+        st.dataframe(trace.to_frame().iloc[::-1])
+
+    st.sidebar.download_button(
+        "Download trace 📥",
+        trace.to_json(),
+        file_name=f"trace-{trace.session}.json",
+        mime="application/json",
+    )
+
+
+def main():
+    setup_profiling()
+    trace = session_trace()
+
+    with trace.activate():
+        show_page()
+
+    show_performance(trace)
+
+
+def show_page():
+    # streamlit config
+    st.set_page_config(
+        page_title="Linkedin Network Visualizer",
+        page_icon="🕸️",
+        initial_sidebar_state="expanded",
+        layout="wide",
+    )
+    st.markdown(
+        """
+        <h1 style='text-align: center; color: whtie;'>Linkedin Network Visualizer</h1>
+        <h3 style='text-align: center; color: white;'>The missing feature in LinkedIn</h3>
+
+        """,
+        unsafe_allow_html=True,
+    )
+
+    # center image
+    col1, col2, col3 = st.columns([1, 5, 1])
+    col2.image("media/app/everything.png", use_column_width=True)
+
+    st.subheader("First, upload your data 💾")
+    st.caption(
+        """
+    Don't know where to find it?
+    [Click here](https://github.com/benthecoder/linkedin-visualizer/tree/main/data_guide#how-to-get-the-data).
+    """
+    )
+    # upload files
+    usr_file = st.file_uploader("Drop your zip file 👇", type={"zip"})
+
+    # if data not uploaded yet, return None
+    if usr_file is None:
+        return
+
+    content_hash = file_hash(usr_file)
+    data = process_data(content_hash, usr_file)
+    prefetch(usr_file, content_hash, data)
+
+    df_ori = data["connections"]
+
+    with st.expander("Show raw data"):
+        st.dataframe(df_ori)
+
+    show_search(usr_file, content_hash, data)
+
+    # the month of the latest connection
+    latest = data["by_date"]["connected_on"].max()
+    month_start = latest.replace(day=1) if pd.notna(latest) else latest
+
+    # everything below shows the filtered connections
+    window = filter_widgets(data)
+    dataset = content_hash
+    # the other sections are only filtered by a narrowed date range
+    dates = None
+    if window is not None:
+        data = filter_data(content_hash, window, data)
+        dataset = hashlib.sha1(f"{content_hash}{window}".encode()).hexdigest()
+        if window[0] is not None or window[1] is not None:
+            dates = window[:2]
+
+    df_clean = data["clean"]
+
+    # Data wrangling
+    agg_df_company = data["company"]
+    agg_df_position = data["position"]
+
+    if agg_df_company.empty or agg_df_position.empty:
+        st.warning("None of your connections match the filters")
+        return
+
+    this_month_df = date_slice(data["by_date"], "connected_on", month_start, latest)
+
+    # Getting some stats
+    # every connection, unless the filters narrowed them down
+    total_conn = len(df_ori) if window is None else len(df_clean)
+    total_label = "Total Connections" if window is None else "Filtered Connections"
+    top_pos = agg_df_position["position"].iloc[0]
+    top_comp = agg_df_company["company"].iloc[0]
+    second_comp = agg_df_company["company"].iloc[1:].tolist() or ["nobody else"]
+    second_comp = second_comp[0]
+    top_pos_count = agg_df_position["count"].iloc[0]
+    first_c = df_clean.iloc[-1]
+    last_c = df_clean.iloc[0]
+
+    # calculating stats
+    st.markdown(
+        """
+        ---
+        ### Here's a breakdown of your connections 👇
+        """
+    )
+
+    # Metrics
+    pos, comp, conn = st.columns(3)
+    pos.metric("Top Position", f"{top_pos[0:18]}..." if len(top_pos) > 18 else top_pos)
+    comp.metric(
+        "Top Company", f"{top_comp[0:18]}..." if len(top_comp) > 18 else top_comp
+    )
+    conn.metric(total_label, f"{total_conn}", len(this_month_df))
+
+    # Summary
+    st.subheader("Full summary")
+    st.markdown(
+        f"""
+        - You have _{len(this_month_df)}_ new ⭐ connections this month, with a total of _{total_conn}_!
+        - Most of your connections work at **{top_comp}**" (dream company?), closely followed by {second_comp}
+        - You love connecting with people 🤵 with the title – **{top_pos}**, _{top_pos_count}_ of them!
+        - Your first ever connection is {first_c['name']} and they work as a {first_c.position} at {first_c.company}
+        - Your most recent connection is {last_c['name']} and they work as a {last_c.position} at {last_c.company}
+
+        ---
+        """
+    )
+
+    # sections
+    section = st.radio("Pick a section to explore 👇", SECTIONS, horizontal=True)
+
+    if section == SECTIONS[0]:
+        show_bar_charts(data, dataset)
+    elif section == SECTIONS[1]:
+        show_timeline(data)
+    elif section == SECTIONS[2]:
+        show_networks(data, content_hash, dataset)
+    elif section == SECTIONS[3]:
+        show_emails(data)
+    elif section == SECTIONS[4]:
+        show_chats(usr_file, content_hash, data["account"], dates)
+    else:
+        show_activity(usr_file, content_hash, data, dates)
+
+    st.sidebar.write(
+        "Interested in the code? Head over to the [Github Repo](https://github.com/benthecoder/linkedin-visualizer)"
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,291 @@
+"""Time and peak memory of every processing stage on a synthetic export
+
+    python benchmarks/bench.py --scale medium --save baseline.json
+    python benchmarks/bench.py --scale medium --baseline baseline.json
+
+Each run happens in a fresh process so no cache carries over between runs.
+Times are the median of --runs runs, peak memory comes from one extra run
+under tracemalloc, which would otherwise slow the timed runs down. With
+--baseline, stages that got slower or bigger than --tolerance are flagged and
+the script exits with an error.
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import tempfile
+import tracemalloc
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from generate import generate
+
+# connections, messages
+SCALES = {
+    "small": (1_000, 10_000),
+    "medium": (10_000, 200_000),
+    "large": (100_000, 2_000_000),
+}
+
+# differences below this many seconds are noise, not regressions
+MIN_SECONDS = 0.05
+
+
+def stages(path: str) -> list:
+    """The pipeline as (stage, function) pairs, each function takes and
+    updates the state of the previous stages"""
+
+    from helpers import (
+        TimeAggregates,
+        agg_sum,
+        clean_df,
+        date_slice,
+        frequency_fingerprint,
+        generate_bipartite_network,
+        generate_endorsement_network,
+        generate_network,
+        invitation_acceptance,
+        plot_bar,
+        plot_chat_hour,
+        plot_chat_people,
+        plot_cumsum,
+        plot_day,
+        plot_invitations,
+        plot_response_times,
+        plot_timeline,
+        plot_wordcloud,
+        replace_fuzzywuzzy_match,
+    )
+    import pandas as pd
+
+    from ingest import EXPORT_TABLES, get_data, read_messages
+    from search import SearchIndex
+
+    def time_aggregates(s):
+        s["timeline"] = TimeAggregates.from_dates(s["clean"]["connected_on"])
+        s["freq"] = s["timeline"].auto_freq()
+
+    def date_window(s):
+        # the last year, like a filter picked in the sidebar
+        by_date = s["clean"].sort_values("connected_on", kind="stable")
+        end = by_date["connected_on"].max()
+        window = date_slice(by_date, "connected_on", end - pd.DateOffset(years=1), end)
+        agg_sum(window, "company")
+        TimeAggregates.from_dates(window["connected_on"])
+
+    def chats_window(s):
+        end = s["chats"].latest.tz_localize(None)
+        s["chats"].window(end - pd.DateOffset(years=1), end).index
+
+    def search(s):
+        index = SearchIndex.build(s["clean"], s["chats"])
+        for query in ("data scientist", "gogle", "first1", "coffee chat"):
+            index.search(query)
+
+    def invitations(s):
+        if "invitations" in s["tables"]:
+            invites = invitation_acceptance(
+                s["tables"]["invitations"], s["connections"]
+            )
+            plot_invitations(invites)
+
+    def endorsement_network(s):
+        if "endorsements" in s["tables"]:
+            generate_endorsement_network(s["tables"]["endorsements"], dataset=path)
+
+    def networks(s):
+        for col_name in ("company", "position"):
+            generate_network(s["clean"], s[col_name], False, 6, path)
+
+    def layouts(s):
+        for col_name in ("company", "position"):
+            generate_network(s["clean"], s[col_name], False, 2, path, layout=True)
+
+    return [
+        ("get_data", lambda s: s.update(get_data(path, data=("connections",)))),
+        ("clean_df", lambda s: s.update(clean=clean_df(s["connections"]))),
+        (
+            "replace_fuzzywuzzy_match",
+            lambda s: replace_fuzzywuzzy_match(
+                s["clean"].copy(), "position", "Data Scientist"
+            ),
+        ),
+        (
+            "agg_sum",
+            lambda s: s.update(
+                company=agg_sum(s["clean"], "company"),
+                position=agg_sum(s["clean"], "position"),
+            ),
+        ),
+        ("plot_bar", lambda s: plot_bar(s["company"], 10, dataset=path)),
+        ("time_aggregates", time_aggregates),
+        ("date_window", date_window),
+        ("plot_timeline", lambda s: plot_timeline(s["timeline"], s["freq"])),
+        ("plot_day", lambda s: plot_day(s["timeline"])),
+        ("plot_cumsum", lambda s: plot_cumsum(s["timeline"], s["freq"])),
+        ("generate_network", networks),
+        ("network_layout", layouts),
+        (
+            "generate_bipartite_network",
+            lambda s: generate_bipartite_network(
+                s["clean"], s["company"], s["position"], False, 2, path
+            ),
+        ),
+        ("read_messages", lambda s: s.update(chats=read_messages(path))),
+        ("conversation_index", lambda s: s["chats"].index),
+        ("chats_window", chats_window),
+        ("search", search),
+        ("plot_chat_hour", lambda s: plot_chat_hour(s["chats"].timeline)),
+        ("plot_chat_people", lambda s: plot_chat_people(s["chats"])),
+        ("plot_response_times", lambda s: plot_response_times(s["chats"].index)),
+        (
+            "plot_wordcloud",
+            lambda s: plot_wordcloud(
+                frequency_fingerprint(s["chats"].words), s["chats"].words
+            ),
+        ),
+        ("read_tables", lambda s: s.update(tables=get_data(path, data=EXPORT_TABLES))),
+        ("invitations", invitations),
+        ("endorsement_network", endorsement_network),
+    ]
+
+
+def import_libraries():
+    """Imports the lazily imported visualization libraries up front, so their
+    import time isn't billed to the first stage using them (see startup.py)"""
+
+    import PIL.Image
+    import plotly.express
+    import pyvis.network
+    import wordcloud
+
+
+def run(path: str, memory: bool = False) -> dict:
+    """Runs every stage once
+
+    Args:
+        path (str): path of the export zip
+        memory (bool, optional): trace peak memory instead of time. Defaults to False.
+
+    Returns:
+        dict: seconds, or peak MB with memory, per stage
+    """
+
+    import_libraries()
+
+    results = {}
+    state = {}
+    for stage, fn in stages(path):
+        if memory:
+            tracemalloc.start()
+            fn(state)
+            results[stage] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            fn(state)
+            results[stage] = time.perf_counter() - start
+    return results
+
+
+def in_fresh_process(path: str, memory: bool = False) -> dict:
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(run, path, memory).result()
+
+
+def benchmark(path: str, runs: int) -> dict:
+    """Median seconds and peak MB per stage"""
+
+    times = [in_fresh_process(path) for _ in range(runs)]
+    peaks = in_fresh_process(path, memory=True)
+    return {
+        stage: {
+            "seconds": statistics.median(t[stage] for t in times),
+            "peak_mb": peaks[stage],
+        }
+        for stage in peaks
+    }
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """Stages slower or bigger than the baseline by more than tolerance"""
+
+    flagged = []
+    for stage, now in results.items():
+        before = baseline.get(stage)
+        if before is None:
+            continue
+
+        slower = now["seconds"] - before["seconds"]
+        if slower > MIN_SECONDS and slower > before["seconds"] * tolerance:
+            flagged.append(
+                f"{stage}: {before['seconds']:.3f}s -> {now['seconds']:.3f}s"
+            )
+        if now["peak_mb"] > before["peak_mb"] * (1 + tolerance) + 1:
+            flagged.append(
+                f"{stage}: {before['peak_mb']:.1f}MB -> {now['peak_mb']:.1f}MB"
+            )
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--connections", type=int, help="overrides --scale")
+    parser.add_argument("--messages", type=int, help="overrides --scale")
+    parser.add_argument(
+        "--export", help="benchmark this zip instead of a synthetic one"
+    )
+    parser.add_argument("--runs", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--save", help="write the results to this baseline json")
+    parser.add_argument("--baseline", help="baseline json to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%"
+    )
+    args = parser.parse_args()
+
+    connections, messages = SCALES[args.scale]
+    size = {
+        "connections": args.connections or connections,
+        "messages": args.messages if args.messages is not None else messages,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.export
+        if path is None:
+            path = str(Path(tmp) / "export.zip")
+            generate(path, **size)
+        results = benchmark(path, args.runs)
+
+    print(f"{'stage':<26} {'seconds':>9} {'peak MB':>9}")
+    for stage, result in results.items():
+        print(f"{stage:<26} {result['seconds']:>9.3f} {result['peak_mb']:>9.1f}")
+
+    if args.save:
+        report = {
+            "export": args.export or size,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "stages": results,
+        }
+        Path(args.save).write_text(json.dumps(report, indent=2))
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline["export"] != (args.export or size):
+            sys.exit(f"{args.baseline} was measured on {baseline['export']}")
+
+        flagged = regressions(results, baseline["stages"], args.tolerance)
+        if flagged:
+            sys.exit("regressions:\n  " + "\n  ".join(flagged))
+        print(f"no regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
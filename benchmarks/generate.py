@@ -0,0 +1,292 @@
+"""Synthetic LinkedIn exports for benchmarking
+
+    python benchmarks/generate.py export.zip --connections 30000 --messages 1000000
+
+Companies and titles follow a long tailed distribution with near duplicate
+spellings ("Google", "Google LLC", "Gogle"), so the fuzzy matching has real
+work to do. Nothing here is read from a real export.
+"""
+
+import argparse
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+COMPANIES = [
+    "Google",
+    "Amazon",
+    "Microsoft",
+    "Meta",
+    "Apple",
+    "Netflix",
+    "IBM",
+    "Oracle",
+    "Salesforce",
+    "Adobe",
+    "Intel",
+    "Nvidia",
+    "Deloitte",
+    "Accenture",
+    "JPMorgan Chase",
+    "Goldman Sachs",
+    "McKinsey & Company",
+    "Stripe",
+    "Shopify",
+    "Spotify",
+]
+COMPANY_SUFFIXES = ["", "", "", " LLC", " Inc", " Corporation", " Ltd"]
+
+TITLES = [
+    "Data Scientist",
+    "Software Engineer",
+    "Product Manager",
+    "Data Analyst",
+    "Recruiter",
+    "Machine Learning Engineer",
+    "Data Engineer",
+    "Designer",
+    "Consultant",
+    "Student",
+]
+SENIORITY = ["", "", "", "Senior ", "Sr. ", "Lead ", "Junior ", "Principal "]
+
+# the long tail is made up words, numbered names would all fuzzy match each other
+SYLLABLES = "ka lo mi nu se ta vi ro be da fe gu ha jo ki lu mo ne pa ri so ze".split()
+
+WORDS = (
+    "hi hello thanks thank you for connecting great to meet opportunity role team "
+    "data science engineering job interview coffee chat resume referral project "
+    "python machine learning startup product launch congrats new position happy "
+    "would love learn more about your work let me know when free next week"
+).split()
+
+
+def typo(names: np.ndarray, rng: np.random.Generator, rate: float) -> np.ndarray:
+    """Drops one character from a fraction of the names"""
+
+    names = names.astype(object)
+    for i in np.flatnonzero(rng.random(len(names)) < rate):
+        name = names[i]
+        cut = rng.integers(1, max(len(name) - 1, 2))
+        names[i] = name[:cut] + name[cut + 1 :]
+    return names
+
+
+def made_up(n: int, rng: np.random.Generator, words: int) -> list:
+    """n made up names of a few capitalized words each"""
+
+    parts = rng.choice(SYLLABLES, size=(n, words, 3))
+    return [" ".join("".join(w).capitalize() for w in name) for name in parts]
+
+
+def long_tail(
+    heads: list, n: int, tail: int, rng: np.random.Generator, words: int
+) -> np.ndarray:
+    """Draws n values, a zipf like mix of the heads and a long tail of rare ones"""
+
+    tail_names = made_up(tail, rng, words)
+    values = np.array(heads + tail_names, dtype=object)
+    weights = 1 / np.arange(1, len(values) + 1) ** 0.9
+    return rng.choice(values, size=n, p=weights / weights.sum())
+
+
+def connections_csv(n: int, rng: np.random.Generator) -> str:
+    companies = long_tail(COMPANIES, n, max(n // 5, 1), rng, 1)
+    companies = companies + rng.choice(COMPANY_SUFFIXES, size=n)
+    companies = typo(companies, rng, 0.02)
+
+    titles = long_tail(TITLES, n, max(n // 10, 1), rng, 2)
+    titles = rng.choice(SENIORITY, size=n) + titles
+    titles = typo(titles, rng, 0.03)
+
+    # connections pick up over the years
+    days = np.sort(rng.power(2.5, size=n) * 3650).astype(int)[::-1]
+    dates = pd.Timestamp("2014-01-01") + pd.to_timedelta(days, unit="D")
+
+    ids = np.arange(n)
+    df = pd.DataFrame(
+        {
+            "First Name": [f"First{i}" for i in ids],
+            "Last Name": [f"Last{i}" for i in ids],
+            "Email Address": np.where(
+                rng.random(n) < 0.1, [f"person{i}@example.com" for i in ids], ""
+            ),
+            "Company": np.where(rng.random(n) < 0.03, "", companies),
+            "Position": np.where(rng.random(n) < 0.02, "", titles),
+            "Connected On": dates.strftime("%d %b %Y"),
+        }
+    )
+
+    notes = 'Notes:\n"When exporting your connection data, ..."\n\n'
+    return notes + df.to_csv(index=False)
+
+
+def messages_csv(
+    n: int, connections: int, rng: np.random.Generator, owner: str = "Owner Person"
+) -> str:
+    # a few people get most of the messages
+    people = np.minimum(rng.zipf(1.3, size=n) - 1, connections - 1)
+    others = np.array([f"First{i} Last{i}" for i in range(connections)], dtype=object)
+    others = others[people]
+
+    sent = rng.random(n) < 0.5
+    seconds = np.sort(rng.integers(0, 5 * 365 * 86400, size=n))
+    dates = pd.Timestamp("2019-01-01") + pd.to_timedelta(seconds, unit="s")
+
+    lengths = rng.integers(3, 30, size=n)
+    words = rng.choice(WORDS, size=lengths.sum())
+    content = [" ".join(w) for w in np.split(words, np.cumsum(lengths)[:-1])]
+    content = np.array(content, dtype=object)
+    with_url = rng.random(n) < 0.05
+    content[with_url] = content[with_url] + " https://example.com/some/page"
+
+    spam = rng.random(n) < 0.05
+
+    df = pd.DataFrame(
+        {
+            "CONVERSATION ID": [f"conversation-{p}" for p in people],
+            "CONVERSATION TITLE": "",
+            "FROM": np.where(sent, owner, others),
+            "SENDER PROFILE URL": "https://www.linkedin.com/in/someone",
+            "TO": np.where(sent, others, owner),
+            "DATE": dates.strftime("%Y-%m-%d %H:%M:%S UTC"),
+            "SUBJECT": np.where(spam, "An exciting opportunity", ""),
+            "CONTENT": np.where(spam, "<p>" + content + "</p>", content),
+            "FOLDER": "INBOX",
+        }
+    )
+
+    return df.to_csv(index=False)
+
+
+SKILLS = [
+    "Python",
+    "SQL",
+    "Machine Learning",
+    "Data Analysis",
+    "Statistics",
+    "Deep Learning",
+    "Communication",
+    "Leadership",
+    "Project Management",
+    "Tableau",
+]
+REACTIONS = ["LIKE", "LIKE", "LIKE", "PRAISE", "EMPATHY", "INTEREST", "APPRECIATION"]
+
+
+def invitations_csv(connections: int, rng: np.random.Generator) -> str:
+    # about one invitation per ten connections, half of them to connections
+    n = max(connections // 10, 1)
+    outgoing = rng.random(n) < 0.6
+    people = np.where(
+        rng.random(n) < 0.5,
+        [f"First{i} Last{i}" for i in rng.integers(0, connections, size=n)],
+        made_up(n, rng, 2),
+    )
+    seconds = rng.integers(0, 365 * 86400, size=n)
+    dates = pd.Timestamp("2023-01-01") + pd.to_timedelta(seconds, unit="s")
+
+    df = pd.DataFrame(
+        {
+            "From": np.where(outgoing, "Owner Person", people),
+            "To": np.where(outgoing, people, "Owner Person"),
+            "Sent At": [f"{d.month}/{d.day}/{d:%y, %-I:%M %p}" for d in dates],
+            "Message": "",
+            "Direction": np.where(outgoing, "OUTGOING", "INCOMING"),
+        }
+    )
+    return df.to_csv(index=False)
+
+
+def positions_csv(rng: np.random.Generator) -> str:
+    starts = pd.date_range("2012-01-01", "2023-01-01", freq="2YS")
+    df = pd.DataFrame(
+        {
+            "Company Name": rng.choice(COMPANIES, size=len(starts)),
+            "Title": rng.choice(TITLES, size=len(starts)),
+            "Description": "",
+            "Location": "Remote",
+            "Started On": starts.strftime("%b %Y"),
+            "Finished On": [
+                *(starts[1:] - pd.DateOffset(months=1)).strftime("%b %Y"),
+                "",
+            ],
+        }
+    )
+    return df.to_csv(index=False)
+
+
+def endorsements_csv(connections: int, rng: np.random.Generator) -> str:
+    n = max(connections // 5, 1)
+    people = rng.integers(0, connections, size=n)
+    seconds = rng.integers(0, 5 * 365 * 86400, size=n)
+    dates = pd.Timestamp("2019-01-01") + pd.to_timedelta(seconds, unit="s")
+
+    df = pd.DataFrame(
+        {
+            "Endorsement Date": dates.strftime("%Y/%m/%d %H:%M:%S UTC"),
+            "Skill Name": rng.choice(SKILLS, size=n, p=np.arange(10, 0, -1) / 55),
+            "Endorser First Name": [f"First{i}" for i in people],
+            "Endorser Last Name": [f"Last{i}" for i in people],
+            "Endorser Public Url": "https://www.linkedin.com/in/someone",
+            "Endorsement Status": "ACCEPTED",
+        }
+    )
+    return df.to_csv(index=False)
+
+
+def reactions_csv(n: int, rng: np.random.Generator) -> str:
+    seconds = np.sort(rng.integers(0, 3 * 365 * 86400, size=n))
+    dates = pd.Timestamp("2021-01-01") + pd.to_timedelta(seconds, unit="s")
+    df = pd.DataFrame(
+        {
+            "Date": dates.strftime("%Y-%m-%d %H:%M:%S"),
+            "Type": rng.choice(REACTIONS, size=n),
+            "Link": [f"https://www.linkedin.com/feed/update/{i}" for i in range(n)],
+        }
+    )
+    return df.to_csv(index=False)
+
+
+def generate(path: str, connections: int = 1000, messages: int = 10000, seed: int = 0):
+    """Writes a synthetic export zip with Connections.csv and messages.csv,
+    and invitations, positions, skills, endorsements and reactions
+
+    Args:
+        path (str): path of the zip to write
+        connections (int, optional): number of connections. Defaults to 1000.
+        messages (int, optional): number of messages. Defaults to 10000.
+        seed (int, optional): random seed. Defaults to 0.
+    """
+
+    rng = np.random.default_rng(seed)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zipObj:
+        zipObj.writestr("Connections.csv", connections_csv(connections, rng))
+        if messages:
+            zipObj.writestr("messages.csv", messages_csv(messages, connections, rng))
+        zipObj.writestr("Invitations.csv", invitations_csv(connections, rng))
+        zipObj.writestr("Positions.csv", positions_csv(rng))
+        zipObj.writestr(
+            "Skills.csv", pd.Series(SKILLS, name="Name").to_csv(index=False)
+        )
+        zipObj.writestr(
+            "Endorsement_Received_Info.csv", endorsements_csv(connections, rng)
+        )
+        zipObj.writestr("Reactions.csv", reactions_csv(connections, rng))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="zip file to write")
+    parser.add_argument("--connections", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.path, args.connections, args.messages, args.seed)
+
+
+if __name__ == "__main__":
+    main()
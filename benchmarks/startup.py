@@ -0,0 +1,62 @@
+"""Import latency of the app modules, each measured in a fresh interpreter
+
+    python benchmarks/startup.py --runs 5 --max 1.5
+
+Exits with an error when the median import time of a module is above --max.
+"""
+
+import sys
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = ["helpers", "ingest", "store", "app"]
+
+SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def import_time(module: str) -> float:
+    """Seconds it takes a fresh interpreter to import module"""
+
+    result = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(module=module)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return float(result.stdout.split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="imports per module")
+    parser.add_argument(
+        "--max", type=float, default=None, help="max median seconds per module"
+    )
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    slow = []
+    for module in args.modules:
+        times = [import_time(module) for _ in range(args.runs)]
+        median = statistics.median(times)
+        print(f"{module:<10} median {median:.3f}s  min {min(times):.3f}s")
+
+        if args.max is not None and median > args.max:
+            slow.append(module)
+
+    if slow:
+        sys.exit(f"imports slower than {args.max}s: {', '.join(slow)}")
+
+
+if __name__ == "__main__":
+    main()
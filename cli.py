@@ -0,0 +1,189 @@
+"""Headless batch mode, processes a directory of LinkedIn exports without streamlit
+
+    python cli.py exports/ --out output/ --workers 4
+
+Every export gets a folder in the output directory with its cleaned tables,
+the other tables of the export, aggregates, charts and networks as static
+html, and the wordcloud as png.
+"""
+
+import time
+import argparse
+import traceback
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from helpers import *
+from ingest import EXPORT_TABLES, get_data, read_messages
+
+
+@contextmanager
+def timed(timings: dict, stage: str):
+    """Adds the seconds spent in the block to timings[stage]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0) + time.perf_counter() - start
+
+
+def process_export(path: str, out: str, top_n: int = 10, cutoff: int = 6) -> dict:
+    """Processes one export and writes the results to out/<export name>
+
+    Args:
+        path (str): path of the export zip
+        out (str): output directory
+        top_n (int, optional): rows in the bar charts. Defaults to 10.
+        cutoff (int, optional): min connections for a network node. Defaults to 6.
+
+    Returns:
+        dict: seconds spent in each stage
+    """
+
+    out = Path(out) / Path(path).stem
+    out.mkdir(parents=True, exist_ok=True)
+
+    timings = {}
+    tables = {}
+    figures = {}
+    html = {}
+
+    with timed(timings, "get_data"):
+        raw = get_data(path, data=("connections",))["connections"]
+
+    with timed(timings, "clean_df"):
+        df_clean = clean_df(raw)
+    tables["connections"] = df_clean
+
+    with timed(timings, "agg_sum"):
+        tables["company"] = agg_sum(df_clean, "company")
+        tables["position"] = agg_sum(df_clean, "position")
+
+    with timed(timings, "plot_bar"):
+        figures["company"] = plot_bar(tables["company"], top_n)
+        figures["position"] = plot_bar(tables["position"], top_n)
+
+    timeline = TimeAggregates.from_dates(df_clean["connected_on"])
+    freq = timeline.auto_freq()
+
+    with timed(timings, "plot_timeline"):
+        figures["timeline"] = plot_timeline(timeline, freq)
+    with timed(timings, "plot_day"):
+        figures["day"] = plot_day(timeline)
+    with timed(timings, "plot_cumsum"):
+        figures["cumsum"] = plot_cumsum(timeline, freq)
+
+    with timed(timings, "generate_network"):
+        for col_name in ("company", "position"):
+            html[f"{col_name}_network"] = generate_network(
+                df_clean, tables[col_name], False, cutoff, path
+            )
+        html["bipartite_network"] = generate_bipartite_network(
+            df_clean, tables["company"], tables["position"], False, cutoff, path
+        )
+
+    with timed(timings, "read_messages"):
+        chats = read_messages(path)
+
+    wordcloud = None
+    if chats is not None and not chats.messages.empty:
+        tables["messages_from"] = chats.agg("FROM")
+        tables["messages_to"] = chats.agg("TO")
+        tables["threads"] = chats.index.threads.reset_index()
+        tables["correspondents"] = chats.index.correspondents
+        tables["words"] = chats.words.rename_axis("word").reset_index(name="count")
+
+        with timed(timings, "plot_bar"):
+            figures["messages_from"] = plot_bar(
+                tables["messages_from"], top_n, title="Messages FROM"
+            )
+            figures["messages_to"] = plot_bar(
+                tables["messages_to"], top_n, title="Messages TO"
+            )
+        with timed(timings, "plot_chat_hour"):
+            figures["chat_hour"] = plot_chat_hour(chats.timeline)
+        with timed(timings, "plot_chat_people"):
+            figures["chat_people"] = plot_chat_people(chats)
+        with timed(timings, "plot_response_times"):
+            figures["response_times"] = plot_response_times(chats.index)
+        with timed(timings, "plot_wordcloud"):
+            wordcloud = plot_wordcloud(frequency_fingerprint(chats.words), chats.words)
+
+    with timed(timings, "read_tables"):
+        extra = get_data(path, data=EXPORT_TABLES)
+    tables.update(extra)
+
+    if "invitations" in extra:
+        tables["invitations"] = invitation_acceptance(extra["invitations"], raw)
+        if not tables["invitations"].empty:
+            with timed(timings, "plot_invitations"):
+                figures["invitations"] = plot_invitations(tables["invitations"])
+    if "endorsements" in extra and not extra["endorsements"].empty:
+        with timed(timings, "generate_network"):
+            html["endorsement_network"] = generate_endorsement_network(
+                extra["endorsements"], dataset=path
+            )
+
+    with timed(timings, "write"):
+        for name, table in tables.items():
+            table.to_csv(out / f"{name}.csv", index=False)
+        for name, fig in figures.items():
+            fig.write_html(out / f"{name}.html", include_plotlyjs="cdn")
+        for name, page in html.items():
+            (out / f"{name}.html").write_text(page, encoding="utf-8")
+        if wordcloud is not None:
+            (out / "wordcloud.png").write_bytes(wordcloud)
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Process a directory of LinkedIn exports without streamlit"
+    )
+    parser.add_argument("exports", help="directory of export zip files")
+    parser.add_argument("--out", default="output", help="output directory")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="processes, defaults to cores"
+    )
+    parser.add_argument("--top-n", type=int, default=10, help="rows in bar charts")
+    parser.add_argument(
+        "--cutoff", type=int, default=6, help="min connections for a network node"
+    )
+    args = parser.parse_args()
+
+    paths = sorted(Path(args.exports).glob("*.zip"))
+    if not paths:
+        parser.error(f"no zip files in {args.exports}")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        jobs = {
+            pool.submit(process_export, str(p), args.out, args.top_n, args.cutoff): p
+            for p in paths
+        }
+        for job in as_completed(jobs):
+            name = jobs[job].stem
+            try:
+                results.append({"export": name, **job.result()})
+                print(f"done {name}")
+            except Exception:
+                results.append({"export": name, "error": traceback.format_exc()})
+                print(f"failed {name}")
+
+    summary = pd.DataFrame(results).set_index("export").sort_index()
+    stages = summary.drop(columns=["error"], errors="ignore")
+    summary["total"] = stages.sum(axis=1)
+
+    Path(args.out).mkdir(parents=True, exist_ok=True)
+    summary.to_csv(Path(args.out) / "summary.csv")
+
+    # seconds per stage
+    print(stages.assign(total=summary["total"]).round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,157 +1,1096 @@
-import streamlit.components.v1 as components
-import streamlit as st
 import pandas as pd
 import numpy as np
+import contextvars
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from io import BytesIO
+from collections import defaultdict, OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache, wraps
+from pathlib import Path
+
+from profiling import profiled
 
 # fuzzy match
-from thefuzz import fuzz
-from thefuzz import process
-
-# visualizations
-import plotly.express as px
-import networkx as nx
-from pyvis.network import Network
-import matplotlib
-import matplotlib.pyplot as plt
-from PIL import Image
-from wordcloud import WordCloud, STOPWORDS, ImageColorGenerator
+from rapidfuzz import fuzz, process, utils
 
 # clean text
 import re
-import nltk
 
-nltk.download("stopwords")
-from nltk.corpus import stopwords
-from nltk.stem.porter import PorterStemmer
+# visualization libraries (plotly, pyvis, PIL, wordcloud) are
+# imported in the functions that use them, so startup doesn't pay for them
 
+# english stopwords from nltk, bundled so startup needs no download
+STOPWORDS_FILE = Path(__file__).parent / "data" / "stopwords.txt"
 
+# shape of the wordcloud
+WORDCLOUD_MASK = Path(__file__).parent / "media" / "linkedin.png"
+
+
+# companies dropped from the analysis
+COMPANY_FILTER = r"[Ff]reelance|[Ss]elf-[Ee]mployed|\.|\-"
+# company names are truncated to this many characters
+COMPANY_MAX_LENGTH = 35
+# repeated strings stored as categoricals
+CATEGORY_COLUMNS = ["name", "company", "position"]
+
+
+def memo(max_entries: int):
+    """Least recently used cache in the spirit of st.experimental_memo, so the
+    helpers work without streamlit. Arguments whose name starts with an
+    underscore are left out of the cache key
+
+    Args:
+        max_entries (int): number of results kept
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+        cache = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(
+                (name, value)
+                for name, value in bound.arguments.items()
+                if not name.startswith("_")
+            )
+
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    return cache[key]
+
+            value = func(*args, **kwargs)
+
+            with lock:
+                cache[key] = value
+                while len(cache) > max_entries:
+                    cache.popitem(last=False)
+
+            return value
+
+        wrapper.clear = cache.clear
+        return wrapper
+
+    return decorator
+
+
+def clean_names(df: pd.DataFrame) -> pd.DataFrame:
+    """Removes spacing and capitalization in column names, without copying the data"""
+    return df.rename(
+        columns=lambda c: re.sub(r"\W+", "_", c.strip().lower()), copy=False
+    )
+
+
+@profiled
 def clean_df(df: pd.DataFrame, privacy: bool = False) -> pd.DataFrame:
     """This function cleans the dataframe containing LinkedIn
-    connections data"
+    connections data. The rows to keep are found with one mask and
+    copied once, repeated strings are stored as categoricals
 
 
     Args:
         df (pd.DataFrame): data frame before cleaning
+        privacy (bool, optional): drop email addresses. Defaults to False.
 
     Returns:
         pd.DataFrame: data frame after cleaning
     """
+
+    df = clean_names(df)
+
+    # truncate company names that exceed
+    company = df["company"].str[:COMPANY_MAX_LENGTH]
+
+    # drop missing values in company and position, and filtered companies
+    keep = (
+        df["position"].notna()
+        & company.notna()
+        & ~company.str.contains(COMPANY_FILTER, regex=True, na=True)
+    )
+
+    clean_df = pd.DataFrame(
+        {
+            column: df.loc[keep, column]
+            for column in df.columns
+            if column not in ("first_name", "last_name")
+        }
+    )
+    clean_df["company"] = company[keep]
+    clean_df["connected_on"] = pd.to_datetime(clean_df["connected_on"])
+    # join first name and last name
+    clean_df["name"] = (
+        df.loc[keep, "first_name"].fillna("")
+        + " "
+        + df.loc[keep, "last_name"].fillna("")
+    ).str.strip()
+
     if privacy:
-        df.drop(columns=["first_name", "last_name", "email_address"])
-    else:
-        clean_df = (
-            df
-            # remomves spacing and capitalization in column names
-            .clean_names()
-            # drop missing values in company and position
-            .dropna(subset=["company", "position"])
-            # join first name and last name
-            .concatenate_columns(
-                column_names=["first_name", "last_name"],
-                new_column_name="name",
-                sep=" ",
-            )
-            # drop first name and last name
-            .drop(columns=["first_name", "last_name"])
-            # truncate company names that exceed
-            .transform_column("company", lambda s: s[:35])
-            .to_datetime("connected_on")
-            .filter_string(
-                column_name="company",
-                search_string=r"[Ff]reelance|[Ss]elf-[Ee]mployed|\.|\-",
-                complement=True,
-            )
+        clean_df = clean_df.drop(columns=["email_address"])
+
+    # fuzzy match titles onto their canonical form and merge near duplicate
+    # company names, both mappings are independent so they are built in
+    # parallel, each in a copy of the caller's context so its stages are traced
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        titles = pool.submit(
+            contextvars.copy_context().run,
+            fuzzy_title_mapping,
+            clean_df["position"].unique(),
+        )
+        companies = pool.submit(
+            contextvars.copy_context().run, company_mapping, clean_df["company"]
         )
 
-    # fuzzy match on Data Scientist titles
-    replace_fuzzywuzzy_match(clean_df, "position", "Data Scientist")
-    # fuzzy match on Software Engineer titles
-    replace_fuzzywuzzy_match(clean_df, "position", "Software Engineer", min_ratio=85)
+        replace_values(clean_df, "position", titles.result())
+        replace_values(clean_df, "company", companies.result())
+
+    for column in CATEGORY_COLUMNS:
+        clean_df[column] = clean_df[column].astype("category")
 
     return clean_df
 
 
+def replace_values(df: pd.DataFrame, column: str, mapping: dict):
+    """Replace the values of a column found in mapping, in place
+
+    Args:
+        df (pd.DataFrame): data frame of connections
+        column (str): column to replace values in
+        mapping (dict): old value -> new value
+    """
+
+    # categoricals only need their categories mapped
+    if df[column].dtype == "category":
+        df[column] = df[column].map(lambda x: mapping.get(x, x)).astype("category")
+        return
+
+    # get rows of all matches and replace them with their new value
+    matches_rows = df[column].isin(mapping.keys())
+    df.loc[matches_rows, column] = df.loc[matches_rows, column].map(mapping)
+
+
+# canonical job titles and the minimum fuzzy score for a title to be mapped onto them
+CANONICAL_TITLES = {
+    "Data Scientist": 75,
+    "Software Engineer": 85,
+}
+
+
+@profiled
+def fuzzy_title_mapping(titles, canonical: dict = CANONICAL_TITLES) -> dict:
+    """Scores every unique title against all canonical titles in one batched pass
+    rapidfuzz github : https://github.com/maxbachmann/RapidFuzz
+
+    The titles are scored as one matrix and mapped onto the best canonical
+    title whose min ratio they reach.
+
+    Args:
+        titles (array-like): titles to match, duplicates are ignored
+        canonical (dict, optional): canonical title -> min ratio. Defaults to CANONICAL_TITLES.
+
+    Returns:
+        dict: title -> canonical title, only for titles that matched
+    """
+
+    names = list(canonical)
+    if not names:
+        return {}
+
+    titles = pd.Series(pd.unique(pd.Series(titles).dropna()), dtype=object)
+    processed = titles.map(utils.default_process)
+
+    if titles.empty:
+        return {}
+
+    # scores has shape (titles, canonical titles)
+    scores = process.cdist(
+        processed.tolist(),
+        [utils.default_process(c) for c in names],
+        scorer=fuzz.WRatio,
+        dtype=np.uint8,
+        workers=-1,
+    )
+    min_ratios = np.array([canonical[c] for c in names])
+    scores = np.where(scores >= min_ratios, scores, -1)
+
+    best = scores.argmax(axis=1)
+    matched = scores.max(axis=1) >= 0
+
+    return dict(zip(titles[matched], np.array(names, dtype=object)[best[matched]]))
+
+
+@profiled
+def normalize_titles(df: pd.DataFrame, column: str, canonical: dict = CANONICAL_TITLES):
+    """Replace every fuzzy match of the canonical titles with the canonical title
+
+    Args:
+        df (pd.DataFrame): data frame of connections
+        column (str): column to perform fuzzy matching
+        canonical (dict, optional): canonical title -> min ratio. Defaults to CANONICAL_TITLES.
+    """
+
+    replace_values(df, column, fuzzy_title_mapping(df[column].unique(), canonical))
+
+
+@profiled
 def replace_fuzzywuzzy_match(
     df: pd.DataFrame, column: str, query: str, min_ratio: int = 75
 ):
     """Replace the fuzz matches with query string
-    thefuzz github : https://github.com/seatgeek/thefuzz
 
     Args:
         df (pd.DataFrame): data frame of connections
         column (str): column to performn fuzzy matching
         query (str): query string
-        min_ratio (int, optional): minimum score to remove. Defaults to 60.
+        min_ratio (int, optional): minimum score to remove. Defaults to 75.
+    """
+
+    normalize_titles(df, column, {query: min_ratio})
+
+
+# legal suffixes ignored when comparing company names
+COMPANY_SUFFIXES = [
+    "inc",
+    "incorporated",
+    "llc",
+    "ltd",
+    "limited",
+    "corp",
+    "corporation",
+    "co",
+    "plc",
+    "gmbh",
+    "ag",
+    "sa",
+    "llp",
+    "lp",
+    "pvt",
+]
+# minimum fuzzy score for two company keys in the same block to be merged
+COMPANY_MIN_RATIO = 90
+
+# company keys remembered across uploads, the least recently seen are forgotten
+COMPANY_CLUSTERS_MAX = 100_000
+
+# company key -> cluster representative key, shared across uploads
+_company_clusters = OrderedDict()
+_company_lock = threading.Lock()
+
+
+def company_keys(names: pd.Series) -> pd.Series:
+    """Lower cases company names and strips punctuation and legal suffixes,
+    so that "Google", "Google LLC" and "Google Inc." share the key "google"
+    """
+
+    keys = (
+        names.str.lower()
+        .str.replace(r"[^\w\s]", " ", regex=True)
+        .str.replace(rf"\b(?:{'|'.join(COMPANY_SUFFIXES)})\b", " ", regex=True)
+        .str.split()
+        .str.join(" ")
+    )
+
+    # names made only of a suffix keep their lower cased name
+    return keys.mask(keys == "", names.str.lower())
+
+
+def _block_key(key: str) -> str:
+    """Blocking key of a company key: the prefix of its first token"""
+    return key[:4].split(" ", 1)[0]
+
+
+@profiled
+def company_key_mapping(keys, min_ratio: int = COMPANY_MIN_RATIO) -> dict:
+    """Clusters company keys, comparing only keys that share a block key.
+
+    Keys already clustered by an earlier upload are looked up, new keys are
+    compared with each other and with known representatives of their block.
+    Two known representatives are never merged, a new key matching both
+    joins the first. At most COMPANY_CLUSTERS_MAX keys are remembered.
+
+    Args:
+        keys (array-like): company keys from company_keys
+        min_ratio (int, optional): minimum score to merge. Defaults to COMPANY_MIN_RATIO.
+
+    Returns:
+        dict: key -> representative key of its cluster
+    """
+
+    keys = set(keys)
+
+    with _company_lock:
+        blocks = defaultdict(list)
+        for key in keys.difference(_company_clusters):
+            blocks[_block_key(key)].append(key)
+
+        representatives = defaultdict(list)
+        for rep in set(_company_clusters.values()):
+            if _block_key(rep) in blocks:
+                representatives[_block_key(rep)].append(rep)
+
+        for block, new_keys in blocks.items():
+            # known representatives go first so they stay the roots
+            pool = representatives[block] + new_keys
+            offset = len(pool) - len(new_keys)
+            parent = list(range(len(pool)))
+
+            def find(i):
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                return i
+
+            if len(pool) > 1:
+                scores = process.cdist(
+                    pool,
+                    new_keys,
+                    scorer=fuzz.ratio,
+                    score_cutoff=min_ratio,
+                    dtype=np.uint8,
+                )
+                for i, j in zip(*np.nonzero(scores)):
+                    a, b = find(i), find(offset + j)
+                    # merging two known clusters would leave the keys stored
+                    # under the one that isn't the root pointing at it
+                    if a != b and max(a, b) >= offset:
+                        parent[max(a, b)] = min(a, b)
+
+            for j, key in enumerate(new_keys):
+                _company_clusters[key] = pool[find(offset + j)]
+
+        mapping = {}
+        for key in keys:
+            _company_clusters.move_to_end(key)
+            mapping[key] = _company_clusters[key]
+        _forget_company_clusters()
+
+        return mapping
+
+
+def _forget_company_clusters():
+    """Drops the least recently seen keys beyond COMPANY_CLUSTERS_MAX, call
+    with _company_lock held"""
+    while len(_company_clusters) > COMPANY_CLUSTERS_MAX:
+        _company_clusters.popitem(last=False)
+
+
+def company_clusters() -> dict:
+    """Copy of the company key clusters learned so far"""
+    with _company_lock:
+        return dict(_company_clusters)
+
+
+def load_company_clusters(clusters: dict):
+    """Adds previously learned company key clusters, e.g. from the local store"""
+    with _company_lock:
+        for key, rep in clusters.items():
+            _company_clusters.setdefault(key, rep)
+        _forget_company_clusters()
+
+
+def company_mapping(companies: pd.Series) -> dict:
+    """Maps near duplicate company names onto the most common spelling
+    in their cluster
+
+    Args:
+        companies (pd.Series): company names
+
+    Returns:
+        dict: company name -> canonical name, only for names that change
     """
 
-    # get list of all unique positions
-    pos_names = df[column].unique()
+    # unique names, most common first
+    names = companies.value_counts()
+    names = pd.Series(names.index, dtype=object)
 
-    # get top 500 close matches
-    matches = process.extract(query, pos_names, limit=500)
+    keys = company_keys(names)
+    clusters = keys.map(company_key_mapping(keys))
 
-    # filter matches with ratio >= 75
-    matching_pos_name = [match[0] for match in matches if match[1] >= min_ratio]
+    canonical = names.groupby(clusters.values).transform("first")
+    changed = names != canonical
 
-    # for position in above_ratio:
-    #     print(f"replacing {position} with {query}")
+    return dict(zip(names[changed], canonical[changed]))
 
-    # get rows of all close matches
-    matches_rows = df[column].isin(matching_pos_name)
 
-    # replace all rows containing close matches with query string
-    df.loc[matches_rows, column] = query
+@profiled
+def normalize_companies(df: pd.DataFrame, column: str = "company"):
+    """Replace near duplicate company names with the most common spelling
+    in their cluster
 
+    Args:
+        df (pd.DataFrame): data frame of connections
+        column (str, optional): column of company names. Defaults to "company".
+    """
 
-def agg_sum(df: pd.DataFrame, name: str) -> pd.DataFrame:
-    """Does a value count on company and positions and sorts by count
+    replace_values(df, column, company_mapping(df[column]))
+
+
+@profiled
+def agg_sum(df: pd.DataFrame, name: str, top: int = None) -> pd.DataFrame:
+    """Counts each company or position, most common first. Categorical
+    columns are counted with a bincount over their codes, and only the top
+    rows are sorted
 
     Args:
         df (pd.DataFrame): data frame before aggregation
         name (str): company | position
+        top (int, optional): number of most common rows to keep. Defaults to None for all.
 
     Returns:
         pd.DataFrame: aggregated data frame
     """
-    df = df[name].value_counts().reset_index()
-    df.columns = [name, "count"]
-    df = df.sort_values(by="count", ascending=False)
-    return df
+
+    column = df[name]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.to_numpy()
+        labels = column.cat.categories
+        counts = np.bincount(codes[codes >= 0], minlength=len(labels))
+    else:
+        value_counts = column.value_counts(sort=False)
+        labels, counts = value_counts.index, value_counts.to_numpy()
+
+    # categoricals also count categories that no longer have rows
+    keep = np.flatnonzero(counts)
+    if top is not None and top < len(keep):
+        keep = keep[np.argpartition(-counts[keep], top)[:top]]
+    keep = keep[np.argsort(-counts[keep], kind="stable")]
+
+    return pd.DataFrame(
+        {name: labels[keep].astype(object), "count": counts[keep].astype("int64")}
+    )
+
+
+def date_slice(df: pd.DataFrame, column: str, start, end) -> pd.DataFrame:
+    """Rows of df from the day start through the day end, found by binary
+    search instead of masking the whole column
+
+    Args:
+        df (pd.DataFrame): data frame sorted by column, oldest first
+        column (str): datetime column, e.g. connected_on
+        start: first day of the window, None for no lower bound
+        end: last day of the window, None for no upper bound
+
+    Returns:
+        pd.DataFrame: the rows of the window, a slice of df
+    """
+    dates = df[column].to_numpy()
+    lo = 0 if start is None else dates.searchsorted(pd.Timestamp(start).to_datetime64())
+    hi = len(df)
+    if end is not None:
+        end = pd.Timestamp(end) + pd.Timedelta(days=1)
+        hi = dates.searchsorted(end.to_datetime64())
+    return df.iloc[lo:hi]
+
+
+# most rows of the bar charts, the max of the Top n sliders
+BAR_MAX_ROWS = 50
 
 
-def plot_bar(df: pd.DataFrame, rows: int, title=""):
-    height = 500
-    if rows > 25:
-        height = 900
+@profiled
+def bar_figure(df: pd.DataFrame, title: str = ""):
+    """Bar chart of the first BAR_MAX_ROWS rows of an aggregated table"""
+    import plotly.express as px
 
     name, count = list(df.columns)
 
     fig = px.histogram(
-        df.head(rows),
+        df.head(BAR_MAX_ROWS),
         x=count,
         y=name,
         template="plotly_dark",
         hover_data={name: False},
     )
     fig.update_layout(
-        height=height,
         width=600,
         margin=dict(pad=5),
         hovermode="y",
         yaxis_title="",
         xaxis_title="",
         title=title,
-        yaxis=dict(autorange="reversed"),
     )
 
     return fig
 
 
-def plot_timeline(df: pd.DataFrame):
-    df = df["connected_on"].value_counts().reset_index()
-    df.rename(columns={"index": "connected_on", "connected_on": "count"}, inplace=True)
-    df = df.sort_values(by="connected_on", ascending=True)
-    fig = px.line(df, x="connected_on", y="count")
+@memo(max_entries=64)
+def cached_bar_figure(dataset: str, name: str, title: str, _df: pd.DataFrame):
+    """bar_figure built once per dataset and table
+
+    Args:
+        dataset (str): hash of the uploaded data
+        name (str): name of the table, e.g. company or FROM
+        title (str): title of the chart
+        _df (pd.DataFrame): aggregated table (not part of the cache key)
+    """
+    return bar_figure(_df, title)
+
+
+@memo(max_entries=256)
+@profiled
+def _bar_rows(dataset: str, name: str, title: str, rows: int, _df: pd.DataFrame):
+    """Copy of the cached bar figure zoomed to rows, cached per rows"""
+    import plotly.graph_objects as go
+
+    fig = go.Figure(cached_bar_figure(dataset, name, title, _df))
+    show_rows(fig, rows)
+    return fig
+
+
+def show_rows(fig, rows: int):
+    """Zooms a bar_figure to its first rows"""
+    fig.update_layout(
+        height=900 if rows > 25 else 500,
+        yaxis=dict(range=[rows - 0.5, -0.5], autorange=False),
+    )
+
+
+def plot_bar(df: pd.DataFrame, rows: int, title="", dataset: str = None):
+    """Bar chart of the first rows of an aggregated table
+
+    Args:
+        df (pd.DataFrame): table from agg_sum, sorted by count
+        rows (int): number of rows to show, at most BAR_MAX_ROWS
+        title (str, optional): title of the chart. Defaults to "".
+        dataset (str, optional): hash of the uploaded data. With it the chart
+            is built once for all rows and only zoomed per rows. Defaults to None.
+
+    Returns:
+        plotly figure
+    """
+
+    if dataset is not None:
+        return _bar_rows(dataset, df.columns[0], title, rows, df)
+
+    fig = bar_figure(df.head(rows), title)
+    show_rows(fig, rows)
+    return fig
+
+
+WEEKDAYS = [
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday",
+]
+
+
+@dataclass
+class TimeAggregates:
+    """Counts of a datetime column, computed once per dataset and shared
+    by the time based plots"""
+
+    daily: pd.Series
+    cumulative: pd.Series
+    weekday: pd.Series
+    hour: pd.Series
+    monthly: pd.Series
+    yearly: pd.Series
+
+    @classmethod
+    @profiled
+    def from_dates(cls, dates: pd.Series) -> "TimeAggregates":
+        """Builds all aggregates of a datetime series
+
+        Args:
+            dates (pd.Series): datetime column, e.g. connected_on
+
+        Returns:
+            TimeAggregates: aggregates of the dates
+        """
+        dates = dates.dropna()
+
+        daily = dates.dt.normalize().value_counts(sort=False)
+        hour = np.bincount(dates.dt.hour, minlength=24)
+
+        return cls.from_counts(daily, hour)
+
+    @classmethod
+    @profiled
+    def from_counts(cls, daily: pd.Series, hour) -> "TimeAggregates":
+        """Builds all aggregates from counts per day and per hour of the day
+
+        Args:
+            daily (pd.Series): count per day, indexed by date
+            hour (array-like): count per hour of the day, 0 to 23
+
+        Returns:
+            TimeAggregates: aggregates of the dates
+        """
+        daily = daily.sort_index()
+        daily.index = pd.DatetimeIndex(daily.index, name="date")
+        daily.name = "count"
+
+        weekday = daily.groupby(daily.index.dayofweek).sum()
+        weekday = weekday.reindex(range(7), fill_value=0)
+        weekday.index = WEEKDAYS
+
+        hour = pd.Series(np.asarray(hour), index=range(24), name="count")
+
+        return cls(
+            daily=daily,
+            cumulative=daily.cumsum(),
+            weekday=weekday,
+            hour=hour,
+            monthly=daily.resample("MS").sum(),
+            yearly=daily.resample("YS").sum(),
+        )
+
+    def resample(self, freq: str = "D") -> pd.Series:
+        """Counts per period, e.g. "W" for weeks or "MS" for months.
+        "D" returns only the days that have counts"""
+        if freq == "D":
+            return self.daily
+        return self.daily.resample(freq).sum()
+
+    def auto_freq(self, max_points: int = 1000) -> str:
+        """Finest of day, week and month that keeps the series under max_points"""
+        if len(self.daily) <= max_points:
+            return "D"
+        span = self.daily.index[-1] - self.daily.index[0]
+        if span.days / 7 <= max_points:
+            return "W"
+        return "MS"
+
+
+def _add_counts(total: pd.Series, counts: pd.Series) -> pd.Series:
+    """Adds the value counts of a chunk to a running total"""
+    counts = counts[counts > 0]
+    if total.empty:
+        return counts
+    return total.add(counts, fill_value=0).astype("int64")
+
+
+def _encode(index: pd.Index, values: pd.Series) -> tuple:
+    """Codes of values in index, growing the index by the values not in it yet
+
+    Returns:
+        tuple: the grown index and the codes, -1 for missing values
+    """
+    values = values.astype(object)
+    new = pd.Index(values.dropna().unique()).difference(index)
+    if len(new):
+        index = index.append(new)
+    return index, index.get_indexer(values).astype("int32")
+
+
+@dataclass
+class ConversationIndex:
+    """Per conversation statistics of the messages, built once from the
+    messages of ChatAggregates by a groupby on the conversation
+
+    threads has one row per conversation with the main correspondent, the
+    number of messages, sent and received by the owner, first and last
+    message, whether the owner started it, whether the other side replied and
+    the owner's median response time. replies has the latency of every
+    message answering a message of someone else, correspondents the message
+    counts per person and day_people everyone the owner talked with per day.
+    """
+
+    owner: str
+    threads: pd.DataFrame
+    replies: pd.DataFrame
+    correspondents: pd.DataFrame
+    day_people: pd.DataFrame
+
+    @classmethod
+    @profiled
+    def from_messages(
+        cls, messages: pd.DataFrame, people: pd.Index, conversation_ids: pd.Index
+    ) -> "ConversationIndex":
+        """Builds the index from the encoded messages
+
+        Args:
+            messages (pd.DataFrame): conversation, sender and recipient codes and DATE
+            people (pd.Index): names of the sender and recipient codes
+            conversation_ids (pd.Index): ids of the conversation codes
+
+        Returns:
+            ConversationIndex: statistics of all conversations
+        """
+
+        m = messages[messages["conversation"] >= 0].sort_values(
+            ["conversation", "DATE"], kind="stable", ignore_index=True
+        )
+
+        # the owner of the export takes part in every conversation
+        participants = pd.concat(
+            [
+                m[["conversation", column]].set_axis(["conversation", "person"], axis=1)
+                for column in ("sender", "recipient")
+            ]
+        )
+        participants = participants[participants["person"] >= 0].drop_duplicates()
+        # -1 matches nobody when there are no messages
+        owner = (
+            participants["person"].value_counts().idxmax() if len(participants) else -1
+        )
+
+        from_owner = (m["sender"] == owner).to_numpy()
+        other = np.where(from_owner, m["recipient"], m["sender"])
+        m = m.assign(from_owner=from_owner, other=other)
+
+        # a reply is a message answering the previous message of someone else
+        conversation = m["conversation"].to_numpy()
+        sender = m["sender"].to_numpy()
+        is_reply = np.zeros(len(m), dtype=bool)
+        is_reply[1:] = (conversation[1:] == conversation[:-1]) & (
+            sender[1:] != sender[:-1]
+        )
+        latency = m["DATE"].diff()
+        replies = pd.DataFrame(
+            {
+                "conversation": conversation[is_reply],
+                "by_owner": from_owner[is_reply],
+                "latency": latency[is_reply].to_numpy(),
+            }
+        )
+
+        grouped = m.groupby("conversation")
+        threads = grouped.agg(
+            messages=("DATE", "size"),
+            sent=("from_owner", "sum"),
+            first=("DATE", "min"),
+            last=("DATE", "max"),
+            started_by_owner=("from_owner", "first"),
+        )
+        threads["received"] = threads["messages"] - threads["sent"]
+        threads["replied"] = np.where(
+            threads["started_by_owner"], threads["received"] > 0, threads["sent"] > 0
+        )
+        threads["response_time"] = (
+            replies[replies["by_owner"]].groupby("conversation")["latency"].median()
+        )
+
+        # the person the owner exchanged the most messages with in each thread
+        main = (
+            m[m["other"] >= 0]
+            .groupby(["conversation", "other"])
+            .size()
+            .sort_values(ascending=False, kind="stable")
+            .reset_index()
+            .drop_duplicates("conversation")
+            .set_index("conversation")["other"]
+        )
+        threads["correspondent"] = pd.Series(people.take(main), index=main.index)
+        threads.index = conversation_ids.take(threads.index)
+        threads.index.name = "conversation"
+
+        known = m[m["other"] >= 0]
+        correspondents = (
+            known.groupby("other")
+            .agg(
+                messages=("DATE", "size"),
+                sent=("from_owner", "sum"),
+                threads=("conversation", "nunique"),
+            )
+            .assign(received=lambda df: df["messages"] - df["sent"])
+            .sort_values("messages", ascending=False, kind="stable")
+        )
+        correspondents.index = people.take(correspondents.index)
+        correspondents.index.name = "person"
+
+        day_people = (
+            pd.DataFrame(
+                {"DATE": known["DATE"].dt.normalize(), "other": known["other"]}
+            )
+            .drop_duplicates()
+            .sort_values("DATE", kind="stable")
+        )
+        day_people = pd.DataFrame(
+            {
+                "DATE": day_people["DATE"].to_numpy(),
+                "person": people.take(day_people["other"]),
+            }
+        )
+
+        return cls(
+            owner=people[owner] if owner >= 0 else None,
+            threads=threads,
+            replies=replies,
+            correspondents=correspondents.reset_index(),
+            day_people=day_people,
+        )
+
+    def reply_rate(self, by_owner: bool = True) -> float:
+        """Share of conversations started by the other side the owner replied
+        to, or with by_owner=False, started by the owner that got a reply"""
+        started = self.threads[self.threads["started_by_owner"] != by_owner]
+        return started["replied"].mean() if len(started) else float("nan")
+
+    def response_times(self, by_owner: bool = True) -> pd.Series:
+        """Latencies of the owner's replies, or of the replies to the owner"""
+        return self.replies.loc[self.replies["by_owner"] == by_owner, "latency"]
+
+
+def format_timedelta(delta: pd.Timedelta) -> str:
+    """Largest two units of a duration, e.g. 2d 4h or 3h 20m, - when missing"""
+
+    if pd.isna(delta):
+        return "-"
+
+    seconds = int(delta.total_seconds())
+    units = [("d", 86400), ("h", 3600), ("m", 60), ("s", 1)]
+    parts = []
+    for unit, size in units:
+        if seconds >= size or (unit == "s" and not parts):
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    return " ".join(parts[:2])
+
+
+@dataclass
+class ChatAggregates:
+    """Running aggregates of the messages, folded in one chunk at a time so
+    the whole messages.csv never has to be held in memory. Of each message
+    only its conversation, sender, recipient and date are kept, as integer
+    codes, for the conversation index. Of the content only the distinct terms
+    of each conversation are kept, codes into vocabulary, for the search index
+
+    The encoded chunks wait in pending_messages and pending_terms and are
+    concatenated once by compact, instead of copying everything folded so far
+    on every chunk"""
+
+    people: pd.Index = field(default_factory=lambda: pd.Index([], dtype=object))
+    conversation_ids: pd.Index = field(
+        default_factory=lambda: pd.Index([], dtype=object)
+    )
+    messages: pd.DataFrame = field(
+        default_factory=lambda: pd.DataFrame(
+            {
+                "conversation": pd.Series(dtype="int32"),
+                "sender": pd.Series(dtype="int32"),
+                "recipient": pd.Series(dtype="int32"),
+                "DATE": pd.Series(dtype="datetime64[ns]"),
+            }
+        )
+    )
+    daily: pd.Series = field(default_factory=lambda: pd.Series(dtype="int64"))
+    hour: np.ndarray = field(default_factory=lambda: np.zeros(24, dtype="int64"))
+    words: pd.Series = field(default_factory=lambda: pd.Series(dtype="int64"))
+    vocabulary: pd.Index = field(default_factory=lambda: pd.Index([], dtype=object))
+    terms: pd.DataFrame = field(
+        default_factory=lambda: pd.DataFrame(
+            {
+                "conversation": pd.Series(dtype="int32"),
+                "term": pd.Series(dtype="int32"),
+            }
+        )
+    )
+    latest: pd.Timestamp = None
+    pending_messages: list = field(default_factory=list, repr=False)
+    pending_terms: list = field(default_factory=list, repr=False)
+
+    @profiled
+    def add(self, chunk: pd.DataFrame):
+        """Folds a chunk of messages into the aggregates
+
+        Args:
+            chunk (pd.DataFrame): messages with a parsed DATE column
+        """
+
+        # local time of the messages
+        dates = chunk["DATE"]
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_localize(None)
+        days = dates.dt.normalize()
+
+        self.daily = _add_counts(self.daily, days.value_counts(sort=False))
+        self.hour += np.bincount(dates.dropna().dt.hour, minlength=24)
+
+        self.conversation_ids, conversation = _encode(
+            self.conversation_ids, chunk["CONVERSATION ID"]
+        )
+        self.people, sender = _encode(self.people, chunk["FROM"])
+        self.people, recipient = _encode(self.people, chunk["TO"])
+        encoded = pd.DataFrame(
+            {
+                "conversation": conversation,
+                "sender": sender,
+                "recipient": recipient,
+                "DATE": dates.to_numpy(),
+            }
+        )
+        self.pending_messages.append(encoded)
+        self.__dict__.pop("index", None)
+        self.__dict__.pop("by_date", None)
+
+        # the content is split into tokens once, for the words and the terms
+        tokens = message_tokens(chunk["CONTENT"])
+        self.words = _add_counts(self.words, word_frequencies(chunk, tokens))
+
+        # distinct terms of each conversation in this chunk, the terms repeated
+        # across chunks are dropped once by compact
+        term, distinct = pd.factorize(tokens)
+        terms = pd.DataFrame(
+            {
+                "conversation": conversation[chunk.index.get_indexer(tokens.index)],
+                "term": term,
+            }
+        )
+        terms = terms[terms["conversation"] >= 0].drop_duplicates()
+        self.vocabulary, codes = _encode(self.vocabulary, pd.Series(distinct))
+        terms["term"] = codes[terms["term"].to_numpy()]
+        self.pending_terms.append(terms)
+
+        if chunk["DATE"].notna().any():
+            latest = chunk["DATE"].max()
+            self.latest = latest if self.latest is None else max(self.latest, latest)
+
+    def compact(self):
+        """Concatenates the chunks folded in since the last call and drops the
+        terms repeated across chunks"""
+
+        if self.pending_messages:
+            self.messages = pd.concat(
+                [self.messages, *self.pending_messages], ignore_index=True
+            )
+            self.pending_messages = []
+        if self.pending_terms:
+            self.terms = pd.concat(
+                [self.terms, *self.pending_terms], ignore_index=True
+            ).drop_duplicates(ignore_index=True)
+            self.pending_terms = []
+
+    @cached_property
+    def index(self) -> ConversationIndex:
+        """Conversation index of the messages folded so far"""
+        self.compact()
+        return ConversationIndex.from_messages(
+            self.messages, self.people, self.conversation_ids
+        )
+
+    @cached_property
+    def by_date(self) -> pd.DataFrame:
+        """The messages folded so far, oldest first"""
+        self.compact()
+        return self.messages.sort_values("DATE", kind="stable", ignore_index=True)
+
+    @profiled
+    def window(self, start, end) -> "ChatAggregates":
+        """Aggregates of only the messages from the day start through the day
+        end. The words and terms are not kept per message, they stay those of
+        all messages
+
+        Args:
+            start: first day of the window, None for no lower bound
+            end: last day of the window, None for no upper bound
+
+        Returns:
+            ChatAggregates: aggregates of the messages in the window
+        """
+
+        messages = date_slice(self.by_date, "DATE", start, end)
+        dates = messages["DATE"].dropna()
+
+        chats = ChatAggregates(
+            people=self.people,
+            conversation_ids=self.conversation_ids,
+            messages=messages.reset_index(drop=True),
+            daily=dates.dt.normalize().value_counts(sort=False),
+            hour=np.bincount(dates.dt.hour, minlength=24),
+            words=self.words,
+            vocabulary=self.vocabulary,
+            terms=self.terms,
+            latest=dates.max() if len(dates) else None,
+        )
+        # already sorted
+        chats.by_date = chats.messages
+        return chats
+
+    @property
+    def timeline(self) -> TimeAggregates:
+        return TimeAggregates.from_counts(self.daily, self.hour)
+
+    def agg(self, column: str) -> pd.DataFrame:
+        """Messages from (FROM) or to (TO) each correspondent of the owner, in
+        the same layout as agg_sum"""
+        count = "received" if column == "FROM" else "sent"
+        counts = self.index.correspondents
+        counts = counts[counts[count] > 0].sort_values(
+            count, ascending=False, kind="stable"
+        )
+        return pd.DataFrame(
+            {column: counts["person"].to_numpy(), "count": counts[count].to_numpy()}
+        )
+
+
+# max number of points sent to the browser per line chart
+MAX_POINTS = 2000
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int = MAX_POINTS) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets downsampling of a line, keeps the
+    points that preserve its visual shape
+
+    Args:
+        x (np.ndarray): sorted x values (numbers or datetimes)
+        y (np.ndarray): y values
+        n_out (int, optional): number of points to keep. Defaults to MAX_POINTS.
+
+    Returns:
+        np.ndarray: sorted positions of the kept points
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # datetimes are compared as nanoseconds
+    x = np.asarray(x)
+    if x.dtype.kind == "M":
+        x = x.astype("int64")
+    x = x.astype(float)
+    y = np.asarray(y, dtype=float)
+
+    # first and last points are always kept, the rest is split into buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    edges[-1] = n - 1
+
+    kept = np.empty(n_out, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+
+        # average point of the next bucket (the last point for the last bucket)
+        if i == n_out - 3:
+            avg_x, avg_y = x[-1], y[-1]
+        else:
+            avg_x = x[hi : edges[i + 2]].mean()
+            avg_y = y[hi : edges[i + 2]].mean()
+
+        # keep the point forming the largest triangle with a and the average
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + area.argmax()
+        kept[i + 1] = a
+
+    return kept
+
+
+@profiled
+def downsample(series: pd.Series, max_points: int = MAX_POINTS) -> pd.Series:
+    """Downsamples a series indexed by date with lttb"""
+    kept = lttb(pd.to_datetime(series.index).values, series.values, max_points)
+    return series.iloc[kept]
+
+
+@profiled
+def plot_timeline(ts: TimeAggregates, freq: str = "D", max_points: int = MAX_POINTS):
+    import plotly.express as px
+
+    df = downsample(ts.resample(freq), max_points).reset_index()
+    fig = px.line(df, x="date", y="count")
 
     # add range slider
     fig.update_layout(
@@ -177,26 +1116,11 @@ def plot_timeline(df: pd.DataFrame):
     return fig
 
 
-def plot_day(df: pd.DataFrame):
+@profiled
+def plot_day(ts: TimeAggregates):
+    import plotly.express as px
 
-    # get weekday name
-    df["weekday"] = df["connected_on"].dt.day_name()
-    df = df["weekday"].value_counts().reset_index()
-    df.rename(columns={"index": "weekday_name", "weekday": "count"}, inplace=True)
-
-    cats = [
-        "Monday",
-        "Tuesday",
-        "Wednesday",
-        "Thursday",
-        "Friday",
-        "Saturday",
-        "Sunday",
-    ]
-    df["weekday_name"] = pd.Categorical(
-        df["weekday_name"], categories=cats, ordered=True
-    )
-    df = df.sort_values("weekday_name")
+    df = ts.weekday.rename_axis("weekday_name").reset_index(name="count")
 
     # plot weekday in plotly
     fig = px.histogram(
@@ -215,13 +1139,14 @@ def plot_day(df: pd.DataFrame):
     return fig
 
 
-def plot_cumsum(df: pd.DataFrame):
-    df = df["connected_on"].value_counts().reset_index()
-    df.rename(columns={"index": "connected_on", "connected_on": "count"}, inplace=True)
-    df = df.sort_values(by="connected_on", ascending=True)
-    df["cum_sum"] = df["count"].cumsum()
+@profiled
+def plot_cumsum(ts: TimeAggregates, freq: str = "D", max_points: int = MAX_POINTS):
+    import plotly.express as px
+
+    df = downsample(ts.resample(freq).cumsum(), max_points)
+    df = df.reset_index(name="cum_sum")
 
-    fig = px.area(df, x="connected_on", y="cum_sum")
+    fig = px.area(df, x="date", y="cum_sum")
 
     fig.update_layout(
         xaxis=dict(
@@ -235,83 +1160,550 @@ def plot_cumsum(df: pd.DataFrame):
     return fig
 
 
+@profiled
 def generate_network(
-    df: pd.DataFrame, agg_df: pd.DataFrame, log_bool: bool, cutoff: int = 5
-):
+    df: pd.DataFrame,
+    agg_df: pd.DataFrame,
+    log_bool: bool,
+    cutoff: int = 5,
+    dataset: str = "",
+    layout: bool = False,
+) -> str:
     """This function generates a network of connections of the user
 
     Args:
         df (pd.DataFrame): data frame containing
-        agg_df (pd.DataFrame):
+        agg_df (pd.DataFrame): aggregated data frame from agg_sum
+        log_bool (bool): log scale the node sizes
         cutoff (int, optional): the min number of connections at which nodes are created. Defaults to 5.
+        dataset (str, optional): hash of the uploaded data, used as the cache key. Defaults to "".
+        layout (bool, optional): place the nodes on the server and turn the
+            physics off, instead of letting the browser simulate them. Defaults to False.
+
+    Returns:
+        str: html page of the network, to be shown with components.html
     """
 
     col_name = agg_df.columns[0]
 
-    # initialize a graph
-    g = nx.Graph()
-    # intialize user as central node
-    g.add_node("you")
+    # cutoffs that keep the same nodes share a cached graph
+    nodes = int((agg_df["count"] >= cutoff).sum())
+    return network_html(dataset, col_name, nodes, log_bool, layout, df, agg_df)
+
+
+@profiled
+def generate_bipartite_network(
+    df: pd.DataFrame,
+    company_df: pd.DataFrame,
+    position_df: pd.DataFrame,
+    log_bool: bool,
+    cutoff: int = 5,
+    dataset: str = "",
+) -> str:
+    """Generates the network of companies and positions, linked by the
+    connections holding a position at a company. Always laid out on the server
+
+    Args:
+        df (pd.DataFrame): cleaned connections
+        company_df (pd.DataFrame): companies aggregated with agg_sum
+        position_df (pd.DataFrame): positions aggregated with agg_sum
+        log_bool (bool): log scale the node sizes
+        cutoff (int, optional): the min number of connections at which nodes are created. Defaults to 5.
+        dataset (str, optional): hash of the uploaded data, used as the cache key. Defaults to "".
+
+    Returns:
+        str: html page of the network, to be shown with components.html
+    """
+
+    nodes = (
+        int((company_df["count"] >= cutoff).sum()),
+        int((position_df["count"] >= cutoff).sum()),
+    )
+    return bipartite_html(dataset, nodes, log_bool, df, company_df, position_df)
+
+
+@memo(max_entries=16)
+@profiled
+def tooltip_index(dataset: str, col_name: str, _df: pd.DataFrame) -> pd.Series:
+    """Builds the hover list of every node in one groupby pass: the positions
+    at each company, or the companies of each position
+
+    Args:
+        dataset (str): hash of the uploaded data
+        col_name (str): company | position
+        _df (pd.DataFrame): cleaned connections (not part of the cache key)
+
+    Returns:
+        pd.Series: html list items, indexed by company or position
+    """
+
+    other = "position" if col_name == "company" else "company"
+    pairs = _df[[col_name, other]].dropna().drop_duplicates()
+
+    items = "<li>" + pairs[other].astype(str) + "</li>"
+    return items.groupby(pairs[col_name], observed=True).sum()
+
+
+def network_nodes(
+    dataset: str,
+    col_name: str,
+    nodes: int,
+    log_bool: bool,
+    df: pd.DataFrame,
+    agg_df: pd.DataFrame,
+) -> pd.DataFrame:
+    """The top rows of agg_df as network nodes: id, label, size and hover title"""
+
+    # reduce size of connections
+    df_reduced = agg_df.head(nodes)
+
+    # store company name and count, the full name is the id as names can
+    # share their first 50 characters
+    ids = df_reduced[col_name].astype(str)
+    names = ids.str[:50]
+    counts = df_reduced["count"]
+
+    tooltips = df_reduced[col_name].map(tooltip_index(dataset, col_name, df))
+    hover_info = (
+        "<b>"
+        + names
+        + "</b> – "
+        + counts.astype(str)
+        + "<ul>"
+        + tooltips.astype(object).fillna("")
+        + "</ul>"
+    )
+
+    sizes = np.log(counts) * 7 if log_bool else counts
+
+    return pd.DataFrame(
+        {
+            "id": ids.to_numpy(),
+            "label": names.to_numpy(),
+            "size": (sizes * 1.7).astype(int).to_numpy(),
+            "title": hover_info.to_numpy(),
+        }
+    )
+
+
+# pixels spanned by the layouts computed on the server
+LAYOUT_SCALE = 1000
+# steps of the force directed layout
+LAYOUT_ITERATIONS = 50
+# nodes every node is pushed away from per step, larger graphs use a sample
+LAYOUT_PIVOTS = 1000
+
+
+def force_layout(
+    n: int,
+    source: np.ndarray,
+    target: np.ndarray,
+    weight: np.ndarray,
+    iterations: int = LAYOUT_ITERATIONS,
+    seed: int = 1,
+) -> np.ndarray:
+    """Fruchterman-Reingold layout with every step vectorized over the node
+    pairs. Above LAYOUT_PIVOTS nodes, each step pushes the nodes away from a
+    random sample of LAYOUT_PIVOTS nodes only, so time and memory grow
+    linearly with the number of nodes
+
+    Args:
+        n (int): number of nodes
+        source (np.ndarray): node number of the first end of every edge
+        target (np.ndarray): node number of the second end of every edge
+        weight (np.ndarray): pull of every edge
+        iterations (int, optional): steps to run. Defaults to LAYOUT_ITERATIONS.
+        seed (int, optional): seed of the starting positions. Defaults to 1.
+
+    Returns:
+        np.ndarray: x and y per node, within [-LAYOUT_SCALE, LAYOUT_SCALE]
+    """
+
+    if n == 0:
+        return np.empty((0, 2), dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n, 2), dtype=np.float32)
+    weight = np.asarray(weight, dtype=np.float32)
+    k = np.float32(1 / np.sqrt(max(n, 1)))
+
+    # the sampled push is scaled up to stand in for all nodes
+    pivots = min(n, LAYOUT_PIVOTS)
+    push = np.float32(k * k * n / max(pivots, 1))
+
+    # the largest step a node takes, cools down every iteration
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        others = pos if pivots == n else pos[rng.choice(n, pivots, replace=False)]
+
+        # nodes push each other apart, with a force of k² / distance
+        dx = pos[:, 0, None] - others[None, :, 0]
+        dy = pos[:, 1, None] - others[None, :, 1]
+        force = dx * dx
+        force += dy * dy
+        np.maximum(force, 1e-4, out=force)
+        np.divide(push, force, out=force)
+        shift = np.stack([(dx * force).sum(axis=1), (dy * force).sum(axis=1)], axis=1)
+
+        # and the edges pull their ends together
+        delta = pos[source] - pos[target]
+        distance = np.maximum(np.sqrt((delta**2).sum(axis=-1)), 0.01)
+        pull = delta * (distance * weight / k)[:, None]
+        np.subtract.at(shift, source, pull)
+        np.add.at(shift, target, pull)
+
+        length = np.maximum(np.sqrt((shift**2).sum(axis=-1)), 0.01)
+        pos += shift * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+
+    # small components drift off, they are pulled back to the edge
+    pos -= np.median(pos, axis=0)
+    extent = np.percentile(np.abs(pos), 98) or 1
+    return np.clip(pos / extent, -1, 1) * LAYOUT_SCALE
+
+
+@memo(max_entries=64)
+@profiled
+def network_layout(
+    dataset: str, name: str, nodes, _edges: pd.DataFrame
+) -> pd.DataFrame:
+    """Positions of the nodes, computed once per dataset, network and number
+    of nodes, so e.g. toggling the log scale reuses them
+
+    Args:
+        dataset (str): hash of the uploaded data
+        name (str): name of the network
+        nodes: number of nodes of the network, part of the cache key
+        _edges (pd.DataFrame): from, to and weight of every edge (not part of the cache key)
+
+    Returns:
+        pd.DataFrame: x and y per node id
+    """
+
+    ids, ends = np.unique(
+        np.concatenate([_edges["from"], _edges["to"]]).astype(str),
+        return_inverse=True,
+    )
+    source, target = np.split(ends, 2)
+    pos = force_layout(len(ids), source, target, np.log1p(_edges["weight"]))
+
+    return pd.DataFrame(pos, index=ids, columns=["x", "y"])
+
+
+def render_network(
+    dataset: str,
+    name: str,
+    nodes: pd.DataFrame,
+    edges: pd.DataFrame,
+    layout: bool,
+    key=None,
+) -> str:
+    """Renders nodes and edges with pyvis
+
+    Args:
+        dataset (str): hash of the uploaded data
+        name (str): name of the network, part of the layout cache key
+        nodes (pd.DataFrame): id, label, size, title and color of every node
+        edges (pd.DataFrame): from, to, weight and color of every edge
+        layout (bool): compute the positions here and turn the physics off
+        key (optional): number of nodes, part of the layout cache key. Defaults to len(nodes).
+
+    Returns:
+        str: html page of the network
+    """
+
+    from pyvis.network import Network
+
+    # a graph without edges has nothing to lay out
+    layout = layout and not edges.empty
+    if layout:
+        pos = network_layout(dataset, name, key or len(nodes), edges)
+        nodes = nodes.join(pos, on="id")
+        nodes["x"] = nodes["x"].round(1)
+        nodes["y"] = nodes["y"].round(1)
 
     # create network and provide specifications
     nt = Network(height="600px", width="700px", bgcolor="black", font_color="white")
 
-    # reduce size of connections
-    df_reduced = agg_df.loc[agg_df["count"] >= cutoff]
+    # the lists are handed to pyvis directly, its add_node and add_edge
+    # check every earlier node and edge for duplicates
+    records = [
+        {key: value for key, value in record.items() if pd.notna(value)}
+        for record in nodes.assign(shape="dot").to_dict("records")
+    ]
+    for record in records:
+        record["font"] = {"color": "white"}
+    nt.nodes = records
+    nt.node_ids = [record["id"] for record in records]
+    nt.node_map = dict(zip(nt.node_ids, records))
+    nt.edges = edges.drop(columns="weight").to_dict("records")
+
+    if layout:
+        nt.toggle_physics(False)
+    else:
+        nt.hrepulsion()
+        nt.toggle_stabilization(True)
+
+    return nt.generate_html()
+
+
+@memo(max_entries=64)
+@profiled
+def network_html(
+    dataset: str,
+    col_name: str,
+    nodes: int,
+    log_bool: bool,
+    layout: bool,
+    _df: pd.DataFrame,
+    _agg_df: pd.DataFrame,
+) -> str:
+    """Builds the pyvis network html in memory
+
+    Args:
+        dataset (str): hash of the uploaded data
+        col_name (str): company | position
+        nodes (int): number of top rows of _agg_df to make nodes of
+        log_bool (bool): log scale the node sizes
+        layout (bool): compute the positions here and turn the physics off
+        _df (pd.DataFrame): cleaned connections (not part of the cache key)
+        _agg_df (pd.DataFrame): aggregated data frame sorted by count (not part of the cache key)
+
+    Returns:
+        str: html page of the network
+    """
+
+    leaves = network_nodes(dataset, col_name, nodes, log_bool, _df, _agg_df)
+    leaves["color"] = "#3449eb"
+
+    # user as central node
+    you = pd.DataFrame({"id": ["you"], "label": ["you"], "size": [10]})
+    edges = pd.DataFrame(
+        {"from": "you", "to": leaves["id"], "weight": 1, "color": "grey"}
+    )
+
+    return render_network(
+        dataset, col_name, pd.concat([you, leaves]), edges, layout, nodes
+    )
+
+
+# node colors of the company and position network
+BIPARTITE_COLORS = {"company": "#3449eb", "position": "#eb9934"}
+
+
+@memo(max_entries=64)
+@profiled
+def bipartite_html(
+    dataset: str,
+    nodes: tuple,
+    log_bool: bool,
+    _df: pd.DataFrame,
+    _company_df: pd.DataFrame,
+    _position_df: pd.DataFrame,
+) -> str:
+    """Builds the company and position network html in memory
+
+    Args:
+        dataset (str): hash of the uploaded data
+        nodes (tuple): number of top companies and positions to make nodes of
+        log_bool (bool): log scale the node sizes
+        _df (pd.DataFrame): cleaned connections (not part of the cache key)
+        _company_df (pd.DataFrame): aggregated companies (not part of the cache key)
+        _position_df (pd.DataFrame): aggregated positions (not part of the cache key)
+
+    Returns:
+        str: html page of the network
+    """
 
-    # use iterrows tp iterate through the data frame
-    for _, row in df_reduced.iterrows():
+    parts = []
+    for col_name, count, agg_df in zip(
+        ("company", "position"), nodes, (_company_df, _position_df)
+    ):
+        part = network_nodes(dataset, col_name, count, log_bool, _df, agg_df)
+        part["names"] = agg_df[col_name].head(count).to_numpy()
+        # a name can be both a company and a position
+        part["id"] = col_name + ": " + part["id"]
+        part["color"] = BIPARTITE_COLORS[col_name]
+        parts.append(part)
+    company, position = parts
+
+    # an edge per company and position held by some connection, as thick as
+    # the number of connections holding it
+    pairs = _df.loc[
+        _df["company"].isin(company["names"]) & _df["position"].isin(position["names"]),
+        ["company", "position"],
+    ]
+    weights = pairs.astype(str).value_counts(sort=False).reset_index(name="weight")
+    edges = pd.DataFrame(
+        {
+            "from": "company: " + weights["company"],
+            "to": "position: " + weights["position"],
+            "weight": weights["weight"].to_numpy(),
+            "width": np.log1p(weights["weight"]).to_numpy(),
+            "title": weights["weight"].astype(str).to_numpy(),
+            "color": "grey",
+        }
+    )
 
-        # store company name and count
-        name = row[col_name][:50]
-        count = row["count"]
+    # only positions and companies with an edge between them
+    linked = pd.concat([company, position]).drop(columns="names")
+    linked = linked[linked["id"].isin(edges["from"]) | linked["id"].isin(edges["to"])]
 
-        title = f"<b>{name}</b> – {count}"
-        positions = set([x for x in df[name == df[col_name]]["position"]])
-        positions = "".join("<li>{}</li>".format(x) for x in positions)
+    return render_network(dataset, "bipartite", linked, edges, True, nodes)
 
-        position_list = f"<ul>{positions}</ul>"
-        hover_info = title + position_list
 
-        if log_bool:
-            count = np.log(count) * 7
+def generate_endorsement_network(
+    endorsements: pd.DataFrame, log_bool: bool = False, dataset: str = ""
+) -> str:
+    """Generates the network of the skills endorsed and the people who
+    endorsed them. Always laid out on the server
 
-        g.add_node(name, size=count * 1.7, title=hover_info, color="#3449eb")
-        g.add_edge("you", name, color="grey")
+    Args:
+        endorsements (pd.DataFrame): endorsements received, as read by get_data
+        log_bool (bool, optional): log scale the node sizes. Defaults to False.
+        dataset (str, optional): hash of the uploaded data, used as the cache key. Defaults to "".
 
-    # generate the graph
-    nt.from_nx(g)
-    nt.hrepulsion()
-    nt.toggle_stabilization(True)
-    nt.show("network.html")
+    Returns:
+        str: html page of the network, to be shown with components.html
+    """
+    return endorsement_html(dataset, log_bool, endorsements)
 
-    # Save and read graph as HTML file (on Streamlit Sharing)
-    try:
-        path = "/tmp"
-        nt.save_graph(f"{path}/network.html")
-        HtmlFile = open(f"{path}/network.html", "r", encoding="utf-8")
 
-    # Save and read graph as HTML file (locally)
-    except:
-        path = "/html_files"
-        nt.save_graph(f"{path}/network.html")
-        HtmlFile = open(f"{path}/network.html", "r", encoding="utf-8")
+# node colors of the endorsement network
+ENDORSEMENT_COLORS = {"skill": "#eb9934", "person": "#3449eb"}
 
-    # Load HTML file in HTML component for display on Streamlit page
-    components.html(HtmlFile.read(), height=650, width=800)
 
+@memo(max_entries=16)
+@profiled
+def endorsement_html(dataset: str, log_bool: bool, _endorsements: pd.DataFrame) -> str:
+    """Builds the endorsement network html in memory
 
-def plot_chat_hour(chats: pd.DataFrame):
-    chats["HOUR"] = chats["DATE"].dt.hour
+    Args:
+        dataset (str): hash of the uploaded data
+        log_bool (bool): log scale the node sizes
+        _endorsements (pd.DataFrame): endorsements received (not part of the cache key)
 
-    # plot chat by hour
+    Returns:
+        str: html page of the network
+    """
+
+    endorser = (
+        _endorsements["Endorser First Name"].fillna("")
+        + " "
+        + _endorsements["Endorser Last Name"].fillna("")
+    ).str.strip()
+    pairs = pd.DataFrame(
+        {"skill": _endorsements["Skill Name"].astype(str), "person": endorser}
+    )
+    pairs = pairs[pairs["person"] != ""]
+
+    # a node per skill and endorser, as big as their number of endorsements
+    parts = []
+    for kind in ("skill", "person"):
+        counts = pairs[kind].value_counts()
+        names = counts.index.to_series()
+        sizes = np.log1p(counts) * 7 if log_bool else counts
+        part = pd.DataFrame(
+            {
+                "id": kind + ": " + names,
+                "label": names.str[:50],
+                "size": (sizes * 1.7 + 5).astype(int),
+                "title": "<b>" + names + "</b> – " + counts.astype(str),
+                "color": ENDORSEMENT_COLORS[kind],
+            }
+        )
+        parts.append(part.reset_index(drop=True))
+
+    weights = pairs.value_counts(sort=False).reset_index(name="weight")
+    edges = pd.DataFrame(
+        {
+            "from": "person: " + weights["person"],
+            "to": "skill: " + weights["skill"],
+            "weight": weights["weight"].to_numpy(),
+            "color": "grey",
+        }
+    )
+
+    return render_network(dataset, "endorsements", pd.concat(parts), edges, True)
+
+
+@profiled
+def invitation_acceptance(
+    invitations: pd.DataFrame, connections: pd.DataFrame
+) -> pd.DataFrame:
+    """Invitations sent and received, with whether the other person is a
+    connection now. The export keeps no answer, a connection is taken as accepted
+
+    Args:
+        invitations (pd.DataFrame): invitations, as read by get_data
+        connections (pd.DataFrame): connections before cleaning, so every
+            connection counts, also those without a company or position
+
+    Returns:
+        pd.DataFrame: direction, person, sent date and connected of every invitation
+    """
+
+    outgoing = invitations["Direction"].astype(str).str.upper() == "OUTGOING"
+    person = invitations["To"].where(outgoing, invitations["From"])
+
+    raw = clean_names(connections)
+    names = raw["first_name"].fillna("") + " " + raw["last_name"].fillna("")
+    names = names.str.strip().str.lower()
+
+    return pd.DataFrame(
+        {
+            "direction": np.where(outgoing, "sent", "received"),
+            "person": person,
+            "sent_at": invitations["Sent At"],
+            "connected": person.fillna("").str.strip().str.lower().isin(names),
+        }
+    )
 
-    chats["HOUR"].value_counts().reset_index(name="count").sort_values(by="index")
+
+def acceptance_rate(invitations: pd.DataFrame, direction: str = "sent") -> float:
+    """Share of the invitations sent or received that became connections"""
+    invites = invitations[invitations["direction"] == direction]
+    return invites["connected"].mean() if len(invites) else float("nan")
+
+
+@profiled
+def plot_invitations(invitations: pd.DataFrame):
+    """Invitations sent and received per month, and how many became connections"""
+    import plotly.express as px
+
+    months = invitations["sent_at"].dt.to_period("M").dt.to_timestamp()
+    counts = (
+        invitations.assign(
+            month=months,
+            status=np.where(invitations["connected"], "connected", "not connected"),
+        )
+        .groupby(["month", "direction", "status"])
+        .size()
+        .reset_index(name="count")
+    )
+
+    fig = px.bar(
+        counts,
+        x="month",
+        y="count",
+        color="status",
+        facet_row="direction",
+        template="plotly_dark",
+    )
+    fig.update_layout(xaxis_title="", height=500)
+    return fig
+
+
+@profiled
+def plot_chat_hour(ts: TimeAggregates):
+    import plotly.express as px
 
     # plot a value count of hours
     fig = px.bar(
-        chats["HOUR"].value_counts().reset_index(name="count").sort_values(by="index"),
-        x="index",
+        ts.hour.rename_axis("HOUR").reset_index(),
+        x="HOUR",
         y="count",
     )
     fig.update_layout(xaxis_title="")
@@ -319,36 +1711,25 @@ def plot_chat_hour(chats: pd.DataFrame):
     return fig
 
 
-def plot_chat_people(chats: pd.DataFrame):
-    # join all people on a particular day into a set
-    chats["DATE"] = chats["DATE"].dt.date
-    date_people = (
-        chats.groupby("DATE")[["FROM", "TO"]]
-        .agg(lambda x: x.unique().tolist())
-        .reset_index()
-    )
-    date_people["people"] = date_people.apply(
-        lambda x: set(x["FROM"] + x["TO"]), axis=1
-    )
-    date_people["people"] = date_people["people"].apply(
-        lambda x: x.difference(["Benedict Neo"])
-    )
-    date_people = date_people[["DATE", "people"]]
-    date_people
+@profiled
+def plot_chat_people(chats: ChatAggregates, max_points: int = MAX_POINTS):
+    import plotly.express as px
+
+    # counts of date, downsampled to the point budget
+    chats_time = downsample(chats.timeline.daily, max_points)
 
-    # counts of date
-    chats_time = chats["DATE"].value_counts().reset_index()
-    chats_time.rename(columns={"index": "DATE", "DATE": "count"}, inplace=True)
-    chats_time.sort_values(by="DATE")
-    chats_time = chats_time.sort_values(by="DATE")
+    # join all people on the kept days, other days never reach the browser
+    people = chats.index.day_people
+    people = people[people["DATE"].isin(chats_time.index)]
+    people = people.groupby("DATE")["person"].agg("<br>".join)
 
-    # merge date_people with chats_time to get people column
-    date_count_people = chats_time.merge(date_people, on="DATE", how="left")
-    # join set into one string and ignore strings that are nan
-    date_count_people["people"] = date_count_people["people"].apply(
-        lambda x: "<br>".join(map(str, x) if str(x) != "nan" else x)
+    date_count_people = pd.DataFrame(
+        {
+            "DATE": chats_time.index,
+            "count": chats_time.values,
+            "people": people.reindex(chats_time.index).fillna("").values,
+        }
     )
-    date_count_people
 
     # value count on date column
     fig = px.line(date_count_people, x="DATE", y="count", hover_data=["people"])
@@ -381,59 +1762,183 @@ def plot_chat_people(chats: pd.DataFrame):
     return fig
 
 
-@st.cache(hash_funcs={matplotlib.figure.Figure: lambda _: None})
-def plot_wordcloud(chats: pd.DataFrame):
+# bins of the response time histogram, from a minute to a year
+RESPONSE_BINS = np.logspace(np.log10(1 / 60), np.log10(24 * 365), 41)
+
+
+@profiled
+def plot_response_times(index: ConversationIndex):
+    import plotly.express as px
+
+    # counts per log scaled bin of hours, so minutes and months both show
+    counts = {
+        who: np.histogram(
+            index.response_times(by_owner) / pd.Timedelta(hours=1), RESPONSE_BINS
+        )[0]
+        for who, by_owner in (("you", True), ("others", False))
+    }
+    df = pd.DataFrame({"hours": RESPONSE_BINS[:-1], **counts}).melt(
+        id_vars="hours", var_name="reply by", value_name="count"
+    )
+
+    fig = px.line(df, x="hours", y="count", color="reply by", line_shape="hv")
+    fig.update_layout(xaxis_title="Hours until reply", yaxis_title="")
+    fig.update_xaxes(type="log")
+    return fig
+
+
+URL_PATTERN = re.compile(r"https?://\S+|www\.\S+")
+WORD_PATTERN = re.compile(r"[a-z]{2,}")
+HTML_TAG_PATTERN = re.compile(r"<[^>]*>")
+# search terms are words and numbers in any script, emails split at @ and dots
+TERM_PATTERN = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=None)
+def stop_words() -> frozenset:
+    """English stopwords from nltk and wordcloud, built once"""
+    from wordcloud import STOPWORDS
+
+    nltk_stopwords = STOPWORDS_FILE.read_text(encoding="utf-8").split()
+    return frozenset(nltk_stopwords) | STOPWORDS
+
+
+@profiled
+def message_tokens(content: pd.Series) -> pd.Series:
+    """Splits messages into tokens in lower case, leaving out urls and html tags
+
+    Args:
+        content (pd.Series): content of the messages
+
+    Returns:
+        pd.Series: one row per token of each message, with the index of the message
+    """
+
+    return (
+        content.dropna()
+        .astype(str)
+        .str.lower()
+        .str.replace(HTML_TAG_PATTERN, " ", regex=True)
+        .str.replace(URL_PATTERN, " ", regex=True)
+        .str.findall(TERM_PATTERN)
+        .explode()
+        .dropna()
+    )
+
+
+@profiled
+def word_frequencies(chats: pd.DataFrame, tokens: pd.Series = None) -> pd.Series:
+    """Counts the words of all non spam chat messages
+
+    Args:
+        chats (pd.DataFrame): messages data frame
+        tokens (pd.Series, optional): tokens of the messages from message_tokens,
+            to not split the content again. Defaults to None.
+
+    Returns:
+        pd.Series: count per word, most common first
+    """
+
+    if tokens is None:
+        tokens = message_tokens(chats["CONTENT"])
 
     # remove spam messages (chats with subject lines are usually spam)
-    chats_nospam = chats[chats.SUBJECT.isnull()]
-    # remove rows where content contains html tags
-    chats_nospam_nohtml = chats_nospam[
-        chats_nospam.CONTENT.str.contains("<|>") == False
-    ]
-    # drop missing value in content column
-    messages = chats_nospam_nohtml.dropna(subset=["CONTENT"])["CONTENT"].values
-
-    corpus = []
-    for i, message in enumerate(messages):
-        # remove urls
-        message = re.sub(r"http[s]\S+", "", message)
-        # keep only letters
-        message = re.sub("[^a-zA-Z]", " ", messages[i])
-        # remove singular letters
-        message = re.sub(r"\s+[a-zA-Z]\s+", " ", message)
-        # convert to lower case
-        message = message.lower()
-        # split into words
-        message = message.split()
-        # remove stop words and singular letters
-        message = [
-            word for word in message if not word in set(stopwords.words("english"))
-        ]
-        message = " ".join(message)
-        corpus.append(message)
-
-    corpus = " ".join(corpus)
-
-    # Import image to np.array
-    linkedin_mask = np.array(Image.open("media/linkedin.png"))
+    # and rows where content contains html tags
+    content = chats["CONTENT"]
+    keep = chats.SUBJECT.isnull() & ~content.str.contains("<|>", na=True)
+    counts = tokens[keep.reindex(tokens.index).to_numpy()].value_counts()
+
+    # keep only words of two letters or more, also those inside tokens like
+    # "covid19", counted once per distinct token instead of per message
+    words = pd.DataFrame(
+        {
+            "word": counts.index.str.findall(WORD_PATTERN),
+            "count": counts.to_numpy(),
+        }
+    ).explode("word")
+    # remove stop words
+    words = words[words["word"].notna() & ~words["word"].isin(stop_words())]
+
+    return (
+        words.groupby("word")["count"]
+        .sum()
+        .sort_values(ascending=False, kind="stable")
+        .rename_axis(None)
+    )
+
+
+@profiled
+def text_terms(texts: pd.Series) -> pd.Series:
+    """Splits texts into their distinct search terms in lower case, leaving
+    out urls and html tags
+
+    Args:
+        texts (pd.Series): texts to split
+
+    Returns:
+        pd.Series: one row per distinct term of each text, with the index of the text
+    """
+
+    return (
+        texts.fillna("")
+        .astype(str)
+        .str.lower()
+        .str.replace(HTML_TAG_PATTERN, " ", regex=True)
+        .str.replace(URL_PATTERN, " ", regex=True)
+        .str.findall(TERM_PATTERN)
+        .map(set)
+        .explode()
+        .dropna()
+    )
+
+
+# width in pixels of the wordcloud shown on the page
+WORDCLOUD_WIDTH = 1200
+
+
+def frequency_fingerprint(frequencies: pd.Series) -> str:
+    """Cheap content hash of a word frequency table, used as a cache key"""
+    hashed = pd.util.hash_pandas_object(frequencies).values
+    return hashlib.sha1(hashed.tobytes()).hexdigest()
+
+
+@memo(max_entries=16)
+@profiled
+def plot_wordcloud(
+    fingerprint: str, _frequencies: pd.Series, width: int = WORDCLOUD_WIDTH
+) -> bytes:
+    """Renders the wordcloud of the word frequencies as a png
+
+    Args:
+        fingerprint (str): frequency_fingerprint of the frequencies, used as the cache key
+        _frequencies (pd.Series): count per word (not part of the cache key)
+        width (int, optional): width of the image, None for the full resolution
+            of the mask. Defaults to WORDCLOUD_WIDTH.
+
+    Returns:
+        bytes: png image
+    """
+
+    from PIL import Image
+    from wordcloud import WordCloud
+
+    # Import image to np.array, scaled down to the width we display
+    mask_image = Image.open(WORDCLOUD_MASK)
+    if width is not None and width < mask_image.width:
+        height = round(mask_image.height * width / mask_image.width)
+        mask_image = mask_image.resize((width, height), Image.NEAREST)
+    linkedin_mask = np.array(mask_image)
+
     wordcloud = WordCloud(
-        width=3000,
-        height=3000,
         random_state=1,
         background_color="black",
         colormap="Blues",  # https://matplotlib.org/stable/tutorials/colors/colormaps.html
-        collocations=False,  # prevent duplicates
-        stopwords=STOPWORDS,
         mask=linkedin_mask,
         contour_color="white",
         contour_width=2,
-    ).generate(corpus)
+    ).generate_from_frequencies(_frequencies.to_dict())
 
-    # show
-    image_colors = ImageColorGenerator(linkedin_mask)
-    fig = plt.figure(figsize=[50, 50])
-    # ax.imshow(wordcloud.recolor(color_func=image_colors), interpolation="bilinear")
-    plt.imshow(wordcloud)
-    plt.axis("off")
+    png = BytesIO()
+    wordcloud.to_image().save(png, format="PNG")
 
-    return fig
+    return png.getvalue()
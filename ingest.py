@@ -0,0 +1,251 @@
+import contextvars
+import pandas as pd
+from zipfile import ZipFile
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from helpers import ChatAggregates
+from profiling import profiled
+
+
+def columns(dtypes: dict) -> dict:
+    """read_csv arguments reading only the given columns with the given dtypes,
+    columns missing from an export are left out instead of failing"""
+    return {"usecols": lambda column: column in dtypes, "dtype": dtypes}
+
+
+# csv members of the LinkedIn export we read, and how to read them
+EXPORT_FILES = {
+    "connections": ("Connections.csv", {"skiprows": 3}),
+    "messages": (
+        "messages.csv",
+        {
+            "dtype": {
+                "CONVERSATION ID": "category",
+                "CONVERSATION TITLE": "category",
+                "FROM": "category",
+                "SENDER PROFILE URL": "category",
+                "TO": "category",
+                "FOLDER": "category",
+            }
+        },
+    ),
+    "invitations": (
+        "Invitations.csv",
+        columns(
+            {
+                "From": "object",
+                "To": "object",
+                "Sent At": "object",
+                "Direction": "category",
+            }
+        ),
+    ),
+    "positions": (
+        "Positions.csv",
+        columns(
+            {
+                "Company Name": "object",
+                "Title": "object",
+                "Location": "category",
+                "Started On": "object",
+                "Finished On": "object",
+            }
+        ),
+    ),
+    "skills": ("Skills.csv", columns({"Name": "object"})),
+    "endorsements": (
+        "Endorsement_Received_Info.csv",
+        columns(
+            {
+                "Endorsement Date": "object",
+                "Skill Name": "category",
+                "Endorser First Name": "object",
+                "Endorser Last Name": "object",
+                "Endorsement Status": "category",
+            }
+        ),
+    ),
+    "reactions": (
+        "Reactions.csv",
+        columns({"Date": "object", "Type": "category", "Link": "object"}),
+    ),
+}
+
+# date columns of the members and their format, parsed without inferring it
+DATE_FORMATS = {
+    "invitations": {"Sent At": "%m/%d/%y, %I:%M %p"},
+    "positions": {"Started On": "%b %Y", "Finished On": "%b %Y"},
+    "endorsements": {"Endorsement Date": "%Y/%m/%d %H:%M:%S UTC"},
+    "reactions": {"Date": "%Y-%m-%d %H:%M:%S"},
+}
+
+# columns the sections can't do without, members lacking any are left out
+REQUIRED_COLUMNS = {
+    "invitations": ["From", "To", "Sent At", "Direction"],
+    "endorsements": [
+        "Endorsement Date",
+        "Skill Name",
+        "Endorser First Name",
+        "Endorser Last Name",
+    ],
+    "reactions": ["Date", "Type"],
+}
+
+# members read only when a section needs them, never for the connections view
+EXPORT_TABLES = ("invitations", "positions", "skills", "endorsements", "reactions")
+
+
+@profiled
+def get_data(usr_file, data=("connections",), workers: int = None) -> dict:
+    """Reads the requested csv files straight out of the uploaded zip,
+    without extracting anything to disk. Several files are parsed at the
+    same time on a pool of threads. messages.csv is better streamed with
+    read_messages than read whole here
+
+    Args:
+        usr_file: uploaded zip file (path or file-like object)
+        data (tuple, optional): keys of EXPORT_FILES to read. Defaults to ("connections",).
+        workers (int, optional): threads parsing files. Defaults to one per file.
+
+    Returns:
+        dict: data frame for each requested key found in the archive with
+            its REQUIRED_COLUMNS, None if nothing was uploaded
+    """
+
+    if usr_file is None:
+        return
+
+    if hasattr(usr_file, "seek"):
+        usr_file.seek(0)
+
+    with ZipFile(usr_file, "r") as zipObj:
+        members = {key: find_member(zipObj, EXPORT_FILES[key][0]) for key in data}
+        members = {key: member for key, member in members.items() if member}
+
+        if len(members) < 2:
+            frames = {
+                key: read_member(zipObj, key, member) for key, member in members.items()
+            }
+            return {key: df for key, df in frames.items() if df is not None}
+
+        # members of one zip can be read at the same time, each job runs in a
+        # copy of the caller's context so its stages are traced
+        with ThreadPoolExecutor(max_workers=workers or len(members)) as pool:
+            jobs = {
+                key: pool.submit(
+                    contextvars.copy_context().run, read_member, zipObj, key, member
+                )
+                for key, member in members.items()
+            }
+            frames = {key: job.result() for key, job in jobs.items()}
+            return {key: df for key, df in frames.items() if df is not None}
+
+
+@profiled
+def read_member(zipObj: ZipFile, key: str, member: str) -> pd.DataFrame:
+    """Parses one csv member of the export with its schema in EXPORT_FILES
+    and the date formats in DATE_FORMATS, None when it lacks one of its
+    REQUIRED_COLUMNS"""
+
+    _, read_kwargs = EXPORT_FILES[key]
+    with zipObj.open(member) as f:
+        df = pd.read_csv(f, **read_kwargs)
+
+    if any(column not in df for column in REQUIRED_COLUMNS.get(key, [])):
+        return None
+
+    for column, date_format in DATE_FORMATS.get(key, {}).items():
+        if column in df:
+            df[column] = parse_dates(df[column], date_format, tz=None)
+
+    return df
+
+
+def find_member(zipObj: ZipFile, file_name: str) -> str:
+    """Returns the path of a file in the zip, or None if it isn't there.
+    Exports may nest files in a folder, so only the file name is matched"""
+
+    for member in zipObj.namelist():
+        if Path(member).name.lower() == file_name.lower():
+            return member
+
+
+# rows of messages.csv parsed at a time
+MESSAGES_CHUNKSIZE = 100_000
+# timezone the message dates are shown in
+MESSAGES_TZ = "US/Central"
+
+
+@profiled
+def parse_dates(
+    dates: pd.Series,
+    date_format: str = "%Y-%m-%d %H:%M:%S UTC",
+    tz: str = MESSAGES_TZ,
+) -> pd.Series:
+    """Parses dates with the fixed export format, falling back to inferring
+    the format only for the dates that don't match it
+
+    Args:
+        dates (pd.Series): dates as written in the export
+        date_format (str, optional): format of the dates. Defaults to the messages' format.
+        tz (str, optional): timezone to convert UTC dates to, None keeps them
+            as written. Defaults to MESSAGES_TZ.
+
+    Returns:
+        pd.Series: parsed dates
+    """
+
+    utc = tz is not None
+    parsed = pd.to_datetime(dates, format=date_format, utc=utc, errors="coerce")
+
+    unmatched = parsed.isna() & dates.notna()
+    if unmatched.any():
+        parsed[unmatched] = pd.to_datetime(dates[unmatched], utc=utc)
+
+    return parsed.dt.tz_convert(tz) if utc else parsed
+
+
+@profiled
+def read_messages(
+    usr_file,
+    chunksize: int = MESSAGES_CHUNKSIZE,
+    chats: ChatAggregates = None,
+) -> ChatAggregates:
+    """Streams messages.csv out of the zip in chunks and folds each chunk
+    into the chat aggregates, so memory doesn't grow with the file
+
+    Args:
+        usr_file: uploaded zip file (path or file-like object)
+        chunksize (int, optional): rows per chunk. Defaults to MESSAGES_CHUNKSIZE.
+        chats (ChatAggregates, optional): aggregates of an earlier export, only
+            messages newer than their latest message are folded in. Defaults to None.
+
+    Returns:
+        ChatAggregates: aggregates of all messages, None if the export has no messages
+    """
+
+    if hasattr(usr_file, "seek"):
+        usr_file.seek(0)
+
+    file_name, read_kwargs = EXPORT_FILES["messages"]
+
+    with ZipFile(usr_file, "r") as zipObj:
+        member = find_member(zipObj, file_name)
+        if member is None:
+            return
+
+        if chats is None:
+            chats = ChatAggregates()
+        since = chats.latest
+
+        with zipObj.open(member) as f:
+            for chunk in pd.read_csv(f, chunksize=chunksize, **read_kwargs):
+                chunk["DATE"] = parse_dates(chunk["DATE"])
+                if since is not None:
+                    chunk = chunk[chunk["DATE"] > since]
+                if not chunk.empty:
+                    chats.add(chunk)
+        chats.compact()
+
+    return chats
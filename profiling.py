@@ -0,0 +1,162 @@
+import json
+import time
+import logging
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+import pandas as pd
+
+# every finished stage is also logged as a json line, so traces of many
+# sessions can be collected from a log file and aggregated
+log = logging.getLogger("linkedin.profiling")
+# only written to LINKEDIN_TRACE_LOG, not to the console of the server
+log.propagate = False
+log.addHandler(logging.NullHandler())
+
+# stages kept per trace, the oldest are dropped first
+MAX_SPANS = 2000
+
+# trace the current code records into, None when nothing is being profiled
+_trace = ContextVar("trace", default=None)
+# stage the current code runs in, to tell nested stages apart
+_parent = ContextVar("parent", default=None)
+# highest traced memory seen so far by the stage the current code runs in. A
+# nested stage resets the peak of tracemalloc, so the peak reached before it
+# is kept here, and the nested stage folds its own peak in when it ends
+_peak = ContextVar("peak", default=None)
+
+# python 3.8 can't reset the peak of tracemalloc, stages only get memory_mb there
+RESET_PEAK = hasattr(tracemalloc, "reset_peak")
+
+
+class Trace:
+    """Timings of the stages that ran for one session
+
+    Each stage is a dict with the session, the rerun it started in, its name,
+    the stage it ran in, start time, seconds, thread and error. When
+    tracemalloc is tracing, also the net change and peak of traced memory in
+    MB, the peak including the stages nested in it. Peaks of stages running
+    at the same time on different threads overlap.
+    """
+
+    def __init__(self, session: str = "", max_spans: int = MAX_SPANS):
+        self.session = session
+        self.run = 0
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """Records the stages run in the block, and in jobs submitted with
+        the block's context, into this trace"""
+
+        self.run += 1
+        token = _trace.set(self)
+        try:
+            yield self
+        finally:
+            _trace.reset(token)
+
+    def add(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+        log.info(json.dumps(span))
+
+    def to_frame(self) -> pd.DataFrame:
+        """One row per finished stage"""
+        with self._lock:
+            return pd.DataFrame(list(self.spans))
+
+    def summary(self) -> pd.DataFrame:
+        """Calls, total and slowest seconds per stage, slowest total first"""
+
+        df = self.to_frame()
+        if df.empty:
+            return df
+
+        agg = {"calls": ("seconds", "size"), "seconds": ("seconds", "sum")}
+        agg["max_seconds"] = ("seconds", "max")
+        if "peak_mb" in df:
+            agg["peak_mb"] = ("peak_mb", "max")
+
+        return (
+            df.groupby("stage")
+            .agg(**agg)
+            .sort_values("seconds", ascending=False)
+            .reset_index()
+        )
+
+    def to_json(self) -> str:
+        with self._lock:
+            spans = list(self.spans)
+        return json.dumps({"session": self.session, "spans": spans}, indent=2)
+
+
+@contextmanager
+def span(stage: str):
+    """Records the block as a stage of the active trace, if there is one"""
+
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+
+    memory = tracemalloc.is_tracing()
+    if memory:
+        before, peak = tracemalloc.get_traced_memory()
+        parent = _peak.get()
+        if RESET_PEAK:
+            if parent is not None:
+                parent[0] = max(parent[0], peak)
+            tracemalloc.reset_peak()
+        highest = [before]
+        peak_token = _peak.set(highest)
+
+    record = {
+        "session": trace.session,
+        "run": trace.run,
+        "stage": stage,
+        "parent": _parent.get(),
+        "start": time.time(),
+        "thread": threading.current_thread().name,
+        "error": None,
+    }
+    token = _parent.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        _parent.reset(token)
+        if memory:
+            _peak.reset(peak_token)
+            current, peak = tracemalloc.get_traced_memory()
+            record["memory_mb"] = (current - before) / 2**20
+            if RESET_PEAK:
+                highest[0] = max(highest[0], peak)
+                if parent is not None:
+                    parent[0] = max(parent[0], highest[0])
+                record["peak_mb"] = (highest[0] - before) / 2**20
+        trace.add(record)
+
+
+def profiled(func):
+    """Records every call of func as a stage named after it"""
+
+    stage = func.__qualname__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _trace.get() is None:
+            return func(*args, **kwargs)
+        with span(stage):
+            return func(*args, **kwargs)
+
+    return wrapper
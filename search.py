@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass
+from rapidfuzz import fuzz, process
+
+from helpers import TERM_PATTERN, ChatAggregates, text_terms
+from profiling import profiled
+
+
+# points a document gets per query word matching one of its terms
+EXACT_SCORE = 3
+PREFIX_SCORE = 2
+FUZZY_SCORE = 1
+# query words shorter than this only match exactly or by prefix
+FUZZY_MIN_LENGTH = 4
+# min rapidfuzz ratio of a term to match a misspelled query word
+FUZZY_MIN_RATIO = 80
+# terms a misspelled query word matches at most
+FUZZY_MAX_TERMS = 20
+# results returned per search
+MAX_RESULTS = 100
+
+# connection columns whose terms are searched
+SEARCH_COLUMNS = ["name", "company", "position", "email_address"]
+
+
+@dataclass
+class SearchIndex:
+    """Inverted index of the terms of the connections and conversations,
+    built once per export so a search never scans the data frames
+
+    documents has one row per connection and conversation with what a search
+    shows of it. terms holds every distinct term sorted, so the terms starting
+    with a prefix are one contiguous range, and the documents containing
+    terms[i] are the rows postings[offsets[i]:offsets[i + 1]] of documents.
+    """
+
+    documents: pd.DataFrame
+    terms: np.ndarray
+    offsets: np.ndarray
+    postings: np.ndarray
+
+    @classmethod
+    @profiled
+    def build(
+        cls, connections: pd.DataFrame, chats: ChatAggregates = None
+    ) -> "SearchIndex":
+        """Indexes the names, companies, positions and emails of the
+        connections, and the correspondents and message content of the
+        conversations
+
+        Args:
+            connections (pd.DataFrame): cleaned connections
+            chats (ChatAggregates, optional): aggregates of the messages. Defaults to None.
+
+        Returns:
+            SearchIndex: index of the connections and conversations
+        """
+
+        people = connections[SEARCH_COLUMNS].astype(object).fillna("")
+        documents = [
+            people.assign(
+                kind="connection",
+                date=connections["connected_on"],
+                messages=pd.NA,
+            )
+        ]
+        text = people["name"]
+        for column in SEARCH_COLUMNS[1:]:
+            text = text + " " + people[column]
+        terms = text_terms(text.reset_index(drop=True))
+        doc_terms = [(terms.index.to_numpy(), terms.to_numpy())]
+
+        if chats is not None and len(chats.conversation_ids):
+            threads = chats.index.threads
+            first = len(people)
+            documents.append(
+                pd.DataFrame(
+                    {
+                        "kind": "conversation",
+                        "name": threads["correspondent"].to_numpy(),
+                        "date": threads["last"].dt.tz_localize(None).to_numpy(),
+                        "messages": threads["messages"].to_numpy(),
+                    }
+                )
+            )
+
+            # document of each conversation code, -1 for conversations without messages
+            document = np.full(len(chats.conversation_ids), -1)
+            codes = chats.conversation_ids.get_indexer(threads.index)
+            document[codes] = first + np.arange(len(threads))
+
+            docs = document[chats.terms["conversation"].to_numpy()]
+            words = chats.vocabulary.take(chats.terms["term"].to_numpy())
+            doc_terms.append((docs, words))
+
+            names = text_terms(threads["correspondent"].reset_index(drop=True))
+            doc_terms.append((first + names.index.to_numpy(), names.to_numpy()))
+
+        docs = np.concatenate([d for d, _ in doc_terms]).astype("int32")
+        words = np.concatenate([w for _, w in doc_terms]).astype(object)
+        keep = docs >= 0
+        docs, words = docs[keep], words[keep]
+
+        # sorting the distinct terms only, not every occurrence
+        term, vocabulary = pd.factorize(words)
+        order = np.argsort(vocabulary)
+        vocabulary = vocabulary[order]
+        rank = np.empty(len(order), dtype="int64")
+        rank[order] = np.arange(len(order))
+        term = rank[term]
+
+        order = np.lexsort((docs, term))
+        offsets = np.zeros(len(vocabulary) + 1, dtype="int64")
+        offsets[1:] = np.cumsum(np.bincount(term, minlength=len(vocabulary)))
+
+        documents = pd.concat(documents, ignore_index=True)
+        documents[SEARCH_COLUMNS] = documents[SEARCH_COLUMNS].fillna("")
+        documents["messages"] = documents["messages"].astype("Int64")
+
+        return cls(
+            documents=documents[["kind", *SEARCH_COLUMNS, "date", "messages"]],
+            terms=vocabulary,
+            offsets=offsets,
+            postings=docs[order],
+        )
+
+    def _postings(self, term: int) -> np.ndarray:
+        return self.postings[self.offsets[term] : self.offsets[term + 1]]
+
+    def lookup(self, word: str) -> pd.Series:
+        """Documents with a term equal to, starting with or close to a word
+
+        Args:
+            word (str): query word in lower case
+
+        Returns:
+            pd.Series: best score of each matching document, by document
+        """
+
+        start, end = np.searchsorted(self.terms, [word, word + "\U0010ffff"])
+        docs = [self.postings[self.offsets[start] : self.offsets[end]]]
+        scores = [PREFIX_SCORE]
+        if start < end and self.terms[start] == word:
+            docs.append(self._postings(start))
+            scores.append(EXACT_SCORE)
+
+        if len(word) >= FUZZY_MIN_LENGTH:
+            matches = process.extract(
+                word,
+                self.terms,
+                scorer=fuzz.ratio,
+                limit=FUZZY_MAX_TERMS,
+                score_cutoff=FUZZY_MIN_RATIO,
+            )
+            for _, _, term in matches:
+                docs.append(self._postings(term))
+                scores.append(FUZZY_SCORE)
+
+        scores = np.repeat(scores, [len(d) for d in docs])
+        return pd.Series(scores, index=np.concatenate(docs)).groupby(level=0).max()
+
+    @profiled
+    def search(self, query: str, limit: int = MAX_RESULTS) -> pd.DataFrame:
+        """Documents matching every word of the query, best matches first
+
+        Each word matches a term exactly, as its prefix, or misspelled, and
+        scores EXACT_SCORE, PREFIX_SCORE or FUZZY_SCORE accordingly.
+
+        Args:
+            query (str): words to search for
+            limit (int, optional): max number of results. Defaults to MAX_RESULTS.
+
+        Returns:
+            pd.DataFrame: matching documents with their score
+        """
+
+        scores = None
+        for word in dict.fromkeys(TERM_PATTERN.findall(query.lower())):
+            matches = self.lookup(word)
+            scores = (
+                matches if scores is None else scores.add(matches).dropna().astype(int)
+            )
+            if scores.empty:
+                break
+
+        if scores is None:
+            scores = pd.Series(dtype="int64")
+
+        top = scores.sort_values(ascending=False, kind="stable")[:limit]
+        return (
+            self.documents.iloc[top.index]
+            .assign(score=top.to_numpy())
+            .reset_index(drop=True)
+        )
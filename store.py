@@ -0,0 +1,176 @@
+import pickle
+import sqlite3
+import hashlib
+import threading
+import pandas as pd
+
+from helpers import (
+    CATEGORY_COLUMNS,
+    COMPANY_MAX_LENGTH,
+    clean_df,
+    clean_names,
+    company_clusters,
+    load_company_clusters,
+    normalize_companies,
+)
+from profiling import profiled
+
+
+class Store:
+    """Local SQLite store of previously processed exports, keyed per account.
+
+    A re-upload of the same account only cleans the connections that are new
+    since the last upload and only folds in newer messages. Updates of one
+    account are serialized, uploads of other accounts don't wait for them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.account_locks = {}
+
+        with self.connect() as db:
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS store (
+                    account TEXT,
+                    name TEXT,
+                    value BLOB,
+                    PRIMARY KEY (account, name)
+                )
+                """
+            )
+
+        # reuse the company clusters learned from earlier uploads
+        load_company_clusters(self.get("", "company_clusters") or {})
+
+    def account_lock(self, account: str) -> threading.Lock:
+        """Lock serializing the updates of one account"""
+        with self.lock:
+            return self.account_locks.setdefault(account, threading.Lock())
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, account: str, name: str):
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT value FROM store WHERE account = ? AND name = ?",
+                (account, name),
+            ).fetchone()
+
+        return pickle.loads(row[0]) if row else None
+
+    def put(self, account: str, name: str, value):
+        with self.connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO store VALUES (?, ?, ?)",
+                (account, name, pickle.dumps(value)),
+            )
+
+    @profiled
+    def update_connections(self, account: str, raw: pd.DataFrame) -> pd.DataFrame:
+        """Cleans only the connections that aren't stored yet for the account
+
+        Args:
+            account (str): account key from account_key
+            raw (pd.DataFrame): connections before cleaning
+
+        Returns:
+            pd.DataFrame: cleaned connections of the whole export
+        """
+
+        keys = connection_keys(raw)
+
+        with self.account_lock(account):
+            stored = self.get(account, "connections")
+            seen = self.get(account, "connection_keys") or set()
+
+            new_rows = ~keys.isin(seen)
+            delta = clean_df(raw[new_rows].set_axis(keys[new_rows]))
+
+            if stored is None:
+                combined = delta
+            else:
+                # new connections go first, the export is sorted newest first,
+                # and connections that were removed since are dropped
+                stored = stored[stored.index.isin(keys)]
+                combined = pd.concat([delta, stored])
+                # the stored rows hold the merged spelling of an earlier upload,
+                # companies are merged again from the spellings in this export
+                # so the result matches cleaning the whole export
+                spelling = clean_names(raw)["company"].str[:COMPANY_MAX_LENGTH]
+                spelling = spelling.set_axis(keys)
+                spelling = spelling[~spelling.index.duplicated()]
+                combined["company"] = spelling.reindex(combined.index).to_numpy()
+                normalize_companies(combined, "company")
+                for column in CATEGORY_COLUMNS:
+                    combined[column] = combined[column].astype("category")
+
+            self.put(account, "connections", combined)
+            self.put(account, "connection_keys", set(keys))
+            self.put("", "company_clusters", company_clusters())
+
+        return combined.reset_index(drop=True)
+
+    @profiled
+    def update_messages(self, account: str, read_messages, usr_file):
+        """Folds only the messages newer than the stored ones for the account
+
+        Args:
+            account (str): account key from account_key
+            read_messages (callable): reader taking the upload and earlier aggregates
+            usr_file: uploaded zip file
+
+        Returns:
+            ChatAggregates: aggregates of all messages, None if the export has no messages
+        """
+
+        with self.account_lock(account):
+            chats = self.get(account, "chats")
+        # aggregates stored before the conversation index, the search terms
+        # or the pending chunks are read again
+        if not hasattr(chats, "pending_terms"):
+            chats = None
+
+        # parsed without holding the lock, the aggregates of a concurrent
+        # upload of the same account are replaced, both hold the whole export
+        chats = read_messages(usr_file, chats=chats)
+        if chats is not None:
+            with self.account_lock(account):
+                self.put(account, "chats", chats)
+
+        return chats
+
+
+def connection_keys(raw: pd.DataFrame) -> pd.Series:
+    """Identifies each connection of a raw export by name and connection date"""
+
+    raw = clean_names(raw)
+    return (
+        raw["first_name"].fillna("")
+        + " "
+        + raw["last_name"].fillna("")
+        + "|"
+        + raw["connected_on"].fillna("").astype(str)
+    )
+
+
+def account_key(raw: pd.DataFrame, oldest: int = 10) -> str:
+    """Identifies the account of an export by its oldest connections, which
+    stay the same between exports of the same account
+
+    Args:
+        raw (pd.DataFrame): connections before cleaning
+        oldest (int, optional): number of oldest connections used. Defaults to 10.
+
+    Returns:
+        str: sha256 hex digest
+    """
+
+    keys = connection_keys(raw)
+    dates = pd.to_datetime(clean_names(raw)["connected_on"], errors="coerce")
+    cutoff = dates.nsmallest(oldest).max()
+
+    oldest_keys = sorted(keys[dates <= cutoff])
+    return hashlib.sha256("\n".join(oldest_keys).encode()).hexdigest()